@@ -7,6 +7,7 @@
 # @date:    2015/01/20 21:55:17
 
 import sys
+import content
 from datetime import datetime
 
 
@@ -20,11 +21,25 @@ def datetime_val(field, val):
     return d.strftime('%Y-%m-%d %H:%M:%S')
 
 
+# fetch the value of a field from finfo, 'lines' is read from the file
+# contents, the other fields are file stats
+def field_getter(field):
+    if field == 'lines':
+        return content.lines
+
+    st_field = 'st_' + field
+    return lambda finfo: getattr(finfo.stat, st_field)
+
+
 class AccuFuncCls(object):
     def val(self):
         pass
 
-    # finfo: dict{'name', 'stat'}
+    # value without formatting, such as the timestamp of max(ctime)
+    def raw_val(self):
+        return self.val()
+
+    # finfo: FileInfo
     def __call__(self, finfo):
         pass
 
@@ -39,6 +54,24 @@ class AccuFuncCls(object):
     def key(self):
         return "%s(%s)" % self.desp()
 
+    # state(tuple): partial result of the files accumulated, which can be
+    # saved and loaded by another AccuFuncCls of the same function
+    def state(self):
+        pass
+
+    def load(self, state):
+        pass
+
+    # accumulate the partial result of other, whose files are after the
+    # files of self
+    def merge(self, other):
+        pass
+
+    # remove finfo accumulated before, return False if it can't be removed
+    # and the files have to be accumulated again
+    def retract(self, finfo):
+        return False
+
 
 class CountFuncCls(AccuFuncCls):
     def __init__(self, field):
@@ -54,15 +87,29 @@ class CountFuncCls(AccuFuncCls):
     def desp(self):
         return 'count', '*'
 
+    def state(self):
+        return (self._count,)
+
+    def load(self, state):
+        self._count, = state
+
+    def merge(self, other):
+        self._count += other._count
+
+    def retract(self, finfo):
+        self._count -= 1
+        return True
+
 
 class SumFuncCls(AccuFuncCls):
     def __init__(self, field):
         self._total = 0
         self._st_field = 'st_' + field
         self._field = field
+        self._getter = field_getter(field)
 
     def __call__(self, finfo):
-        self._total += getattr(finfo['stat'], self._st_field)
+        self._total += self._getter(finfo)
 
     def val(self):
         return self._total
@@ -70,46 +117,94 @@ class SumFuncCls(AccuFuncCls):
     def desp(self):
         return 'sum', self._field
 
+    def state(self):
+        return (self._total,)
+
+    def load(self, state):
+        self._total, = state
+
+    def merge(self, other):
+        self._total += other._total
+
+    def retract(self, finfo):
+        self._total -= self._getter(finfo)
+        return True
+
 
 class MaxFuncCls(AccuFuncCls):
     def __init__(self, field):
         self._max = 0
         self._st_field = 'st_' + field
         self._field = field
+        self._getter = field_getter(field)
         self._fname = None
 
     def __call__(self, finfo):
-        v = getattr(finfo['stat'], self._st_field)
+        v = self._getter(finfo)
         if v > self._max:
             self._max = v
-            self._fname = finfo['name']
+            self._fname = finfo.name
 
     def val(self):
         return datetime_val(self._st_field, self._max)
 
+    def raw_val(self):
+        return self._max
+
     def desp(self):
         return 'max', self._field
 
+    def state(self):
+        return self._max, self._fname
+
+    def load(self, state):
+        self._max, self._fname = state
+
+    def merge(self, other):
+        if other._max > self._max:
+            self._max, self._fname = other._max, other._fname
+
+    def retract(self, finfo):
+        # the max is unknown without the other files if it's removed
+        return self._getter(finfo) < self._max
+
 
 class MinFuncCls(AccuFuncCls):
     def __init__(self, field):
         self._min = sys.maxint
         self._st_field = 'st_' + field
         self._field = field
+        self._getter = field_getter(field)
         self._fname = None
 
     def __call__(self, finfo):
-        v = getattr(finfo['stat'], self._st_field)
+        v = self._getter(finfo)
         if v < self._min:
             self._min = v
-            self._fname = finfo['name']
+            self._fname = finfo.name
 
     def val(self):
         return datetime_val(self._st_field, self._min)
 
+    def raw_val(self):
+        return self._min
+
     def desp(self):
         return 'min', self._field
 
+    def state(self):
+        return self._min, self._fname
+
+    def load(self, state):
+        self._min, self._fname = state
+
+    def merge(self, other):
+        if other._min < self._min:
+            self._min, self._fname = other._min, other._fname
+
+    def retract(self, finfo):
+        return self._getter(finfo) > self._min
+
 
 class AvgFuncCls(AccuFuncCls):
     def __init__(self, field):
@@ -117,13 +212,31 @@ class AvgFuncCls(AccuFuncCls):
         self._total = 0
         self._st_field = 'st_' + field
         self._field = field
+        self._getter = field_getter(field)
 
     def __call__(self, finfo):
-        self._total += getattr(finfo['stat'], self._st_field)
+        self._total += self._getter(finfo)
         self._count += 1
 
     def val(self):
+        if not self._count:
+            return 0
         return self._total / self._count / 1.0
 
     def desp(self):
         return 'avg', self._field
+
+    def state(self):
+        return self._total, self._count
+
+    def load(self, state):
+        self._total, self._count = state
+
+    def merge(self, other):
+        self._total += other._total
+        self._count += other._count
+
+    def retract(self, finfo):
+        self._total -= self._getter(finfo)
+        self._count -= 1
+        return True
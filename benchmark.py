@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    benchmark
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-19 15:02:17
+
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+from collections import OrderedDict
+from groupby import GroupBy
+from walker import LocalFs, Walker, ThreadedWalker, travel_context, scandir
+from fqs import export_fqs, FqsWalker, FROM_PREFIX
+from fileinfo import FileInfo
+from grammar_parser import like_predicate, name_suffixes_predicate
+
+
+class LatencyFs(LocalFs):
+    '''
+        LocalFs which sleeps 'latency' seconds in each operation, simulates
+        FUSE mounted object stores and remote file systems
+    '''
+    def __init__(self, latency):
+        self._latency = latency
+
+    def list(self, d):
+        time.sleep(self._latency)
+        return LocalFs.list(self, d)
+
+    def stat(self, f):
+        time.sleep(self._latency)
+        return LocalFs.stat(self, f)
+
+
+def make_tree(root, fanout, depth, files):
+    '''
+        create a tree with 'fanout' directories and 'files' files in each
+        directory, 'depth' levels deep
+    '''
+    for i in xrange(files):
+        with open(os.path.join(root, 'f%d.txt' % i), 'w') as f:
+            f.write('x' * i)
+
+    if depth <= 1:
+        return
+
+    for i in xrange(fanout):
+        d = os.path.join(root, 'd%d' % i)
+        os.mkdir(d)
+        make_tree(d, fanout, depth - 1, files)
+
+
+def count_groupby():
+    return GroupBy(dimension_aggr=OrderedDict({'*': lambda a: '*'}))
+
+
+def timeit(fn, *args, **kwargs):
+    start = time.time()
+    ret = fn(*args, **kwargs)
+    return time.time() - start, ret
+
+
+def bench_walk(opt, root):
+    '''
+        compare the sync and the thread engines on a file system with
+        latency injected in each operation
+    '''
+    fs = LatencyFs(opt.latency / 1000.0)
+
+    def walk(walker_cls, **kwargs):
+        files = []
+        w = walker_cls(lambda finfo, alias: True, files, count_groupby(),
+                       opt.depth + 1, fs=fs, **kwargs)
+        w.walk(root)
+        return sorted(os.path.join(f.path, f.name) for f in files)
+
+    sync_cost, sync_files = timeit(walk, Walker)
+    thread_cost, thread_files = timeit(walk, ThreadedWalker,
+                                       concurrency=opt.concurrency)
+    if sync_files != thread_files:
+        raise Exception('engines returned different files')
+
+    print 'files: %d, latency: %dms' % (len(sync_files), opt.latency)
+    print 'sync:   %.3fs' % sync_cost
+    print 'thread: %.3fs (concurrency %d, %.1fx)' % (
+        thread_cost, opt.concurrency, sync_cost / thread_cost)
+
+
+def drop_caches():
+    '''
+        drop the page cache, dentries and inodes, return False if it's not
+        permitted
+    '''
+    os.system('sync')
+    try:
+        with open('/proc/sys/vm/drop_caches', 'w') as f:
+            f.write('3\n')
+        return True
+    except IOError:
+        return False
+
+
+def bench_stat(opt, root):
+    '''
+        compare the stat throughput of the entries stat'ed in the order of
+        the listing and in the order of their inodes, on a cold cache if
+        the caches can be dropped
+    '''
+    def walk(inode_order):
+        cold = drop_caches()
+        ctx = travel_context(root)
+        ctx['inode_order'] = inode_order
+        files = []
+        cost, _ = timeit(Walker(lambda finfo, alias: True, files,
+                                count_groupby(), opt.depth + 1,
+                                ctx=ctx).walk, root)
+        return cost, cold, [os.path.join(f.path, f.name) for f in files]
+
+    listing_cost, cold, listing_files = walk(False)
+    inode_cost, cold, inode_files = walk(True)
+    if listing_files != inode_files:
+        raise Exception('inode order returned different files')
+
+    print 'files: %d, cache: %s, inodes from scandir: %s' % (
+        len(listing_files), 'cold' if cold else 'warm(run as root to drop)',
+        'yes' if scandir else 'no(stat in listing order)')
+    print 'listing order: %.3fs, %d stats/s' % (
+        listing_cost, len(listing_files) / listing_cost)
+    print 'inode order:   %.3fs, %d stats/s (%.1fx)' % (
+        inode_cost, len(inode_files) / inode_cost, listing_cost / inode_cost)
+
+
+def bench_fqs(opt, root):
+    '''
+        compare a query on the live tree with the same query on its columnar
+        snapshot
+    '''
+    fqs_path = root + '.fqs'
+    export_cost, count = timeit(export_fqs, fqs_path, root,
+                                {'depth': opt.depth + 1})
+
+    def query(walker_cls, start_point):
+        files = []
+        w = walker_cls(lambda finfo, alias: finfo.stat.st_size > opt.files / 2,
+                       files, count_groupby(), opt.depth + 1)
+        w.walk(start_point)
+        return [os.path.join(f.path, f.name) for f in files]
+
+    try:
+        live_cost, live_files = timeit(query, Walker, root)
+        fqs_cost, fqs_files = timeit(query, FqsWalker, FROM_PREFIX + fqs_path)
+        size = os.path.getsize(fqs_path)
+    finally:
+        os.unlink(fqs_path)
+
+    if live_files != fqs_files:
+        raise Exception('snapshot returned different files')
+
+    print 'entries: %d, matched: %d, snapshot: %d bytes, export: %.3fs' % (
+        count, len(live_files), size, export_cost)
+    print 'live:     %.3fs' % live_cost
+    print 'snapshot: %.3fs (%.1fx)' % (fqs_cost, live_cost / fqs_cost)
+
+
+def bench_like(opt, root):
+    '''
+        compare the LIKE predicates compiled by shape with regexes matched on
+        every name
+    '''
+    files = []
+    Walker(lambda finfo, alias: True, files, count_groupby(),
+           opt.depth + 1).walk(root)
+    finfos = [FileInfo(f.name, f.path, None) for f in files] * 20
+
+    def regex_predicate(pattern):
+        regex = re.compile(pattern.replace('.', '\\.').replace('%', '.*') +
+                           '$')
+        return lambda finfo, alias: regex.match(finfo.name) is not None
+
+    def count(fn):
+        return sum(1 for finfo in finfos if fn(finfo, None))
+
+    cases = [
+        ('prefix', 'f1%'),
+        ('suffix', '%.txt'),
+        ('substring', '%1.t%'),
+        ('regex', 'f%.t%t'),
+    ]
+    print 'names: %d' % len(finfos)
+    for case, pattern in cases:
+        regex_cost, regex_count = timeit(count, regex_predicate(pattern))
+        like_cost, like_count = timeit(count, like_predicate(pattern))
+        if regex_count != like_count:
+            raise Exception('different matches of %s' % pattern)
+        print '%-10s regex: %.3fs, like: %.3fs (%.1fx)' % (
+            case, regex_cost, like_cost, regex_cost / like_cost)
+
+    suffixes = ['%.txt', '%.log', '%.gz', '%.tmp']
+    regexes = [regex_predicate(s) for s in suffixes]
+    or_cost, or_count = timeit(count, lambda finfo, alias:
+                               any(fn(finfo, alias) for fn in regexes))
+    tuple_cost, tuple_count = timeit(count, name_suffixes_predicate(
+        tuple(s[1:] for s in suffixes)))
+    if or_count != tuple_count:
+        raise Exception('different matches of %s' % suffixes)
+    print '%-10s regex: %.3fs, like: %.3fs (%.1fx)' % (
+        'or suffix', or_cost, tuple_cost, or_cost / tuple_cost)
+
+
+benchmarks = OrderedDict([
+    ('walk', bench_walk),
+    ('stat', bench_stat),
+    ('fqs', bench_fqs),
+    ('like', bench_like),
+])
+
+
+def opt_parse():
+    usage = 'USAGE: %prog [options] ' + '|'.join(benchmarks.keys())
+    parser = OptionParser(usage=usage)
+    parser.add_option('--fanout', dest='fanout', default=4, type='int',
+                      help='directories in each directory')
+    parser.add_option('--depth', dest='depth', default=3, type='int',
+                      help='levels of the generated tree')
+    parser.add_option('--files', dest='files', default=8, type='int',
+                      help='files in each directory')
+    parser.add_option('--latency', dest='latency', default=5, type='int',
+                      help='latency of each file system operation in ms')
+    parser.add_option('--concurrency', dest='concurrency', default=16,
+                      type='int', help='concurrency of the thread engine')
+
+    return parser, parser.parse_args()
+
+
+if __name__ == '__main__':
+    parser, (opt, args) = opt_parse()
+    if not args or args[0] not in benchmarks:
+        parser.print_usage()
+        sys.exit(1)
+
+    root = tempfile.mkdtemp(prefix='fql-bench-')
+    try:
+        make_tree(root, opt.fanout, opt.depth, opt.files)
+        benchmarks[args[0]](opt, root)
+    finally:
+        shutil.rmtree(root)
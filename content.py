@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    content
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-19 10:12:30
+
+import os
+import mmap
+import stat
+import threading
+from multiprocessing.pool import ThreadPool
+from walker import BudgetExceeded
+
+
+# size of the slice used to count lines of a mapped file
+_LINES_CHUNK = 1024 * 1024
+
+
+def file_path(finfo):
+    return os.path.join(finfo.path, finfo.name)
+
+
+def contains(finfo, literal):
+    return finfo.reader.contains(finfo, literal)
+
+
+def lines(finfo):
+    if finfo.lines is None:
+        finfo.lines = finfo.reader.lines(finfo)
+
+    return finfo.lines
+
+
+class ContentReader(object):
+    '''
+        Read file contents through memory mapping. All the reads of a query
+        are charged to one reader, which stops the query when more than
+        'max_bytes' bytes have been read.
+    '''
+    def __init__(self, max_bytes=None, workers=4, with_lines=False):
+        self._max_bytes = max_bytes
+        self._with_lines = with_lines
+        self._bytes_read = 0
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._pool = None
+
+    def select(self, selector, finfos, aliases):
+        '''
+            evaluate selector on each finfo in the bounded I/O pool, the
+            results keep the order of finfos. Lines of the matched files are
+            counted in the pool too if the query needs them.
+        '''
+        def select_fn(finfo):
+            finfo.reader = self
+            matched = selector(finfo, aliases)
+            if matched and self._with_lines:
+                lines(finfo)
+            return matched
+
+        if self._pool is None:
+            self._pool = ThreadPool(self._workers)
+        return self._pool.imap(select_fn, finfos)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def bytes_read(self):
+        return self._bytes_read
+
+    def contains(self, finfo, literal):
+        m = self._map(finfo)
+        if m is None:
+            return False
+
+        try:
+            idx = m.find(literal)
+            self._charge(len(m) if idx == -1 else idx + len(literal))
+            return idx != -1
+        finally:
+            m.close()
+
+    def lines(self, finfo):
+        m = self._map(finfo)
+        if m is None:
+            return 0
+
+        try:
+            size = len(m)
+            self._charge(size)
+            count = 0
+            for off in xrange(0, size, _LINES_CHUNK):
+                count += m[off: off + _LINES_CHUNK].count('\n')
+
+            # the last line may not be terminated by '\n'
+            if size and m[size - 1] != '\n':
+                count += 1
+
+            return count
+        finally:
+            m.close()
+
+    def _map(self, finfo):
+        # only regular and non-empty files can be mapped
+        st = finfo.stat
+        if not st.st_size or not stat.S_ISREG(st.st_mode):
+            return None
+
+        try:
+            with open(file_path(finfo), 'rb') as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError):
+            # mmap.error of the files which can't be mapped, such as the
+            # files in /proc
+            return None
+
+    def _charge(self, nbytes):
+        with self._lock:
+            self._bytes_read += nbytes
+            if self._max_bytes and self._bytes_read > self._max_bytes:
+                raise BudgetExceeded('exceed max bytes to read, limit: %d, '
+                                     'read: %d' % (self._max_bytes,
+                                                   self._bytes_read))
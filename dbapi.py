@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    dbapi
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-22 10:36:18
+
+from itertools import islice
+from collections import OrderedDict
+from executor import PreparedStatement, typed_rows, query_printer, \
+    close_query
+from print_utils import JoinPrinter
+from join import JoinQuery
+
+
+'''
+DB-API like interface to embed fql in Python code:
+    conn = connect(depth=5)
+    cur = conn.cursor()
+    cur.execute('select name, size from /data where size > ?', (1048576, ))
+    for name, size in cur:
+        ...
+    cur.execute('select ftype, count(*) from /data group by ftype')
+    while True:
+        rows = cur.fetchmany(100)
+        ...
+
+Rows are tuples of raw values, nothing is formatted: sizes and lines are
+int, times are float seconds since epoch, and aggregations are numbers.
+'''
+
+
+# max statements prepared by a connection
+_MAX_STATEMENTS = 256
+
+# conf of a connection, the same as the options of fql.py
+_DEFAULT_CONF = {
+    'depth': 3,
+    'show_border': True,
+    'io_threads': 4,
+    'engine': 'sync',
+    'concurrency': 16,
+}
+
+
+def connect(**conf):
+    return Connection(conf)
+
+
+class Connection(object):
+    '''
+        conf and statements prepared for the cursors, statements are parsed
+        once for each connection. The params of a statement are bound in
+        its parse result, so a connection is used by one thread.
+    '''
+    def __init__(self, conf):
+        self.conf = dict(_DEFAULT_CONF)
+        self.conf.update(conf)
+        # stmt -> PreparedStatement
+        self._statements = OrderedDict()
+
+    def cursor(self):
+        return Cursor(self)
+
+    def prepare(self, stmt):
+        prepared = self._statements.get(stmt)
+        if prepared is None:
+            prepared = PreparedStatement(stmt)
+            if len(self._statements) >= _MAX_STATEMENTS:
+                self._statements.popitem(last=False)
+            self._statements[stmt] = prepared
+
+        return prepared
+
+    def close(self):
+        self._statements.clear()
+
+
+class Cursor(object):
+    '''
+        result of the last statement executed. The tree is travelled by
+        'execute', and the rows are fetched from the sorted files or groups
+        when they are iterated.
+    '''
+    def __init__(self, conn):
+        self._conn = conn
+        # rows returned by 'fetchmany' without size
+        self.arraysize = 100
+        # (name, type_code, display_size, internal_size, precision, scale,
+        # null_ok) of each column, only name is given
+        self.description = None
+        # query of the last statement, or JoinQuery of join
+        self._query = None
+        self._rows = iter([])
+
+    @property
+    def partial(self):
+        '''
+            why the result is partial, such as a budget is exceeded. None if
+            the result is complete. The rows of join are returned while the
+            roots are travelled, it's known after they are fetched.
+        '''
+        if isinstance(self._query, JoinQuery):
+            return self._query.partial
+        return self._query['partial'] if self._query else None
+
+    @property
+    def view_refresh(self):
+        '''
+            stats of the refresh of a view by the last statement, None if no
+            view is refreshed, see 'executor.refresh_view'
+        '''
+        if self._query is None or isinstance(self._query, JoinQuery):
+            return None
+        return self._query['view_refresh']
+
+    def execute(self, stmt, params=()):
+        self.close()
+
+        self._query = self._conn.prepare(stmt).run(params, **self._conn.conf)
+        if isinstance(self._query, JoinQuery):
+            fields, rows = self._query.fields, self._query.rows()
+        else:
+            fields, rows = typed_rows(self._query)
+        self.description = [(f, None, None, None, None, None, None)
+                            for f in fields]
+        self._rows = iter(rows)
+        return self
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchmany(self, size=None):
+        return list(islice(self._rows, size or self.arraysize))
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return self._rows
+
+    def printer(self):
+        '''
+            printer of the result of the last statement, see 'print_utils'
+        '''
+        if isinstance(self._query, JoinQuery):
+            return JoinPrinter(self._query.fields, list(self._rows),
+                               self._conn.conf.get('show_border'))
+        return query_printer(self._query)
+
+    def close(self):
+        '''
+            remove the temporary files of the last result
+        '''
+        if isinstance(self._query, JoinQuery):
+            self._query.close()
+        elif self._query is not None:
+            close_query(self._query)
+        self._query = None
+        self.description = None
+        self._rows = iter([])
@@ -6,15 +6,28 @@
 # @author:  chosen0ne(louzhenlin86@126.com)
 # @date:    2019-05-15 16:53:45
 
-import os.path
-import glob
 import os
+import sys
 import json
+import time
+import content
 from collections import OrderedDict
-from print_utils import FieldPrinter, AggregatePrinter, GroupPrinter
-from grammar_parser import parser
+from print_utils import FieldPrinter, AggregatePrinter, GroupPrinter, \
+    JoinPrinter, ALL_FIELDS
+from accu_func import field_getter
+from grammar_parser import parser, lexer
 from groupby import GroupBy
 from accu_func import AccuFuncCls
+from content import ContentReader
+from walker import Walker, ThreadedWalker, travel_context, BudgetExceeded, \
+    Progress, skipped_paths
+from extsort import FileRows
+from fqs import FqsFs, FqsWalker, FROM_PREFIX
+from ignore import IGNORE_FILES
+from join import JoinQuery
+from view import ViewStore, ViewWalker, VIEW_PREFIX, new_view, \
+    view_context, ordered_partials
+from watch import WatchQuery
 
 
 func_type = type(lambda a: 0)
@@ -22,6 +35,12 @@ MODE_SELECT_FIELDS = 1
 MODE_SELECT_AGGR = 2
 MODE_GROUP_AGGR = 3
 
+_STAT_FIELDS = set(['size', 'ctime', 'mtime', 'atime'])
+
+# keys of the parse result of a statement, the others are conf
+_STMT_KEYS = ('select', 'from', 'where', 'order', 'limit', 'group',
+              'exclude', 'join', 'view', 'watch')
+
 
 def execute_statement(stmt, conf={}):
     stmts = parser.parse(stmt)
@@ -41,11 +60,11 @@ def execute(**kwargs):
             - aggregation name on field -> aggregation function creator
                 - max(size) -> lambda
         - 'dimension_aggr' -> OrderedDict{str ->
-           str func(finfo{'name', 'stat'})}
+           str func(finfo(FileInfo))}
             - dimension aggregation name on field -> dimension fetch function
                 - minute(atime) -> lambda / ftype -> lambda
     - from(str): directory to be query
-    - where(boolean func(finfo{'name', 'stat'})): filter files base on name or
+    - where(boolean func(finfo(FileInfo))): filter files base on name or
       file stats
     - order(OrderedDict{str -> str}): sort the result
         - field name -> 'asc' or 'desc'
@@ -54,34 +73,238 @@ def execute(**kwargs):
         - [limit, start]
     - group(dict{str -> OrderedDict}): group result by some dimensions
         - 'dimension_aggr' -> OrderedDict{str ->
-          str func(finfo{'name', 'stat'})}
+          str func(finfo(FileInfo))}, a group is keyed by the tuple of
+          values if there are several dimensions
             - minute(atime) -> lambda / ftype -> lambda
         - 'having' -> dict{str -> object}
             - aggregations -> OrderedDict{str ->
-              str func(finfo{'name', 'stat'})}
+              str func(finfo(FileInfo))}
                 - having on the aggregation function on fields
             - fn -> boolean func(dict{str -> val})
                 - str -> val => aggregation function on field -> number
                     - max(size) -> 100
+    - join(dict{str -> str}): join 'from' with another root, see
+      'plan_join'
+        - 'how' -> 'inner', 'left' or 'full'
+        - 'root' -> the right root
+        - 'key' -> 'relpath' or 'name'
+    - view(dict{str -> str}): create or refresh a view, see 'run_view'
+        - 'cmd' -> 'create' or 'refresh'
+        - 'name' -> name of the view
+        - 'stmt' -> the statement of the view to create
+    - watch(dict{str -> object}): refresh the aggregations of the statement
+      until interrupted, see 'run_watch'
+        - 'stmt' -> the statement watched
+        - 'interval' -> seconds between the refreshes
+    '''
+    if kwargs.get('watch'):
+        run_watch(**kwargs)
+        return
+
+    if kwargs.get('join'):
+        output_join(plan_join(**kwargs), kwargs.get('show_border'))
+        return
+
+    if _is_view(kwargs):
+        query = run_view(**kwargs)
+        try:
+            output_view(query)
+        finally:
+            close_query(query)
+        return
+
+    query = plan_query(**kwargs)
+    walk_queries(query['from'], [query], kwargs)
+    try:
+        output_query(query)
+    finally:
+        close_query(query)
+
+
+def prepare(stmt, conf={}):
+    '''
+        parse the statement with '?' placeholders once, see
+        'PreparedStatement'
+    '''
+    return PreparedStatement(stmt, conf)
+
+
+class PreparedStatement(object):
     '''
+        A statement parsed once and executed with different params. The
+        placeholders '?' in the conditions on size, time, name and the
+        having conditions are bound by position before each execution, the
+        predicates built by the parser read the bound values.
+            stmt = prepare('select name from /data where size > ? and '
+                           'name like ?')
+            stmt.execute((1024, '%.log'))
+            fields, rows = stmt.query((0, '%.gz'))
+        The params are bound in the parse result, so a statement is
+        executed by one thread at a time.
+    '''
+    def __init__(self, stmt, conf={}):
+        lex = lexer.clone()
+        lex.params = []
+        stmts = parser.parse(stmt, lexer=lex)
+        if stmts is None:
+            raise Exception('failed to parse, statement: %s' % stmt)
+
+        self.stmt = stmt
+        self._stmts = stmts
+        self._params = lex.params
+        self._conf = conf
+
+    def param_count(self):
+        return len(self._params)
+
+    def execute(self, params=(), **conf):
+        '''
+            execute with params and print the result
+        '''
+        execute(**self._bind(params, conf))
+
+    def query(self, params=(), **conf):
+        '''
+            execute with params, return fields and list of rows
+        '''
+        query = self.run(params, **conf)
+        if isinstance(query, JoinQuery):
+            printer = JoinPrinter(query.fields, list(query.rows()), False)
+            return printer.fields(), list(printer.rows())
+
+        try:
+            printer = query_printer(query)
+            return printer.fields(), list(printer.rows())
+        finally:
+            close_query(query)
+
+    def run(self, params=(), **conf):
+        '''
+            execute with params, return the query whose files and groupby
+            are filled, which is closed by 'close_query'. A JoinQuery is
+            returned for join.
+        '''
+        kwargs = self._bind(params, conf)
+        if kwargs.get('watch'):
+            raise Exception('watch runs until interrupted, it\'s executed by '
+                            '\'execute\' or a WatchQuery')
+        if kwargs.get('join'):
+            return plan_join(**kwargs)
+        if _is_view(kwargs):
+            return run_view(**kwargs)
+
+        query = plan_query(**kwargs)
+        try:
+            walk_queries(query['from'], [query], kwargs)
+        except:
+            close_query(query)
+            raise
+
+        return query
+
+    def _bind(self, params, conf):
+        if len(params) != len(self._params):
+            raise Exception('statement has %d params, got %d: %s'
+                            % (len(self._params), len(params), self.stmt))
+
+        for param, val in zip(self._params, params):
+            param.bind(val)
+
+        kwargs = dict(self._stmts)
+        kwargs.update(self._conf)
+        kwargs.update(conf)
+        return kwargs
+
+
+def execute_batch(stmts, conf={}):
+    '''
+        execute several statements, the queries from the same directory share
+        one travel of the file tree. Outputs are printed in the order of
+        stmts, each is identical to the output of the statement executed
+        alone.
+    '''
+    queries = []
+    for stmt in stmts:
+        kwargs = parser.parse(stmt)
+        if kwargs is None:
+            raise Exception('failed to parse, statement: %s' % stmt)
+        kwargs.update(conf)
+        queries.append(plan_query(**kwargs))
+
+    # from(str) -> list of queries
+    roots = OrderedDict()
+    for q in queries:
+        roots.setdefault(q['from'], []).append(q)
+
+    for root, root_queries in roots.items():
+        walk_queries(root, root_queries, conf)
+
+    for q in queries:
+        try:
+            output_query(q)
+        finally:
+            close_query(q)
+
+
+def plan_join(**kwargs):
+    '''
+        build the JoinQuery of a statement joining two roots, the roots are
+        travelled when it's built and its rows are returned while they're
+        travelled
+    '''
+    s_stmt = kwargs.get('select') or {'field': {'*': 1}}
+    w_stmt = kwargs.get('where', lambda row, alias: True)
+    e_stmt = kwargs.get('exclude') or {}
+    if getattr(w_stmt, 'cost', 0):
+        raise Exception('conditions on file contents aren\'t supported in '
+                        'join')
+
+    return JoinQuery(kwargs.get('from', '.'), kwargs['join'],
+                     s_stmt['field'].keys(), w_stmt, kwargs.get('limit'),
+                     _any_matched(e_stmt.get('exclude')),
+                     _any_matched(e_stmt.get('prune')), kwargs)
+
+
+def output_join(join, show_border):
+    JoinPrinter(join.fields, list(join.rows()), show_border).print_table()
+    if join.partial:
+        print 'PARTIAL RESULT: %s' % join.partial
+
+
+def plan_query(**kwargs):
+    '''
+        check the statement and build the query, whose files and groupby are
+        filled by 'walk_queries' and printed by 'output_query'
+    '''
+    if kwargs.get('join'):
+        raise Exception('join can only be executed alone')
+    if _is_view(kwargs):
+        raise Exception('statements on views can only be executed alone')
+    if kwargs.get('watch'):
+        raise Exception('watch can only be executed alone')
+
     s_stmt = kwargs.get('select', ('select', ['*']))
     f_stmt = kwargs.get('from', '.')
     w_stmt = kwargs.get('where', lambda finfo, alias: True)
     o_stmt = kwargs.get('order')
     l_stmt = kwargs.get('limit')
     g_stmt = kwargs.get('group')
+    e_stmt = kwargs.get('exclude') or {}
 
     is_debug = kwargs.get('debug')
-    max_depth = kwargs.get('depth')
+    # 0 means no limit
+    max_depth = kwargs.get('depth') or sys.maxint
     show_border = kwargs.get('show_border')
+    sort_buffer = kwargs.get('sort_buffer') or 0
+    group_buffer = kwargs.get('group_buffer') or 0
 
     if is_debug:
         o = json.dumps(kwargs, indent=4, separators=(',', ':'),
                        cls=OuputJsonEncoder)
         print 'kwargs:', o
 
-    show_fields = set([f for f in s_stmt['field']]) if 'field' in s_stmt else \
-        set()
+    # in the order of select
+    show_fields = list(s_stmt['field']) if 'field' in s_stmt else []
     accu_funcs = s_stmt['aggregations'] if 'aggregations' in s_stmt else {}
     dim_fields = '&'.join([k for k in s_stmt['dimension_aggr'].keys()]) \
         if 'dimension_aggr' in s_stmt else None
@@ -126,8 +349,17 @@ def execute(**kwargs):
     g_stmt['accu_funcs'] = accu_funcs
     g_stmt['order_accu_funcs'] = o_stmt['aggregations'] if o_stmt else None
     g_stmt['aliases'] = aliases
+    g_stmt['mem_budget'] = group_buffer * 1024 * 1024
+
+    # subtrees without any match aren't travelled, see 'pushdown_hints'
+    path_prefixes = getattr(w_stmt, 'path_prefixes', None)
+    depth_hint = getattr(w_stmt, 'max_depth', None)
+    if depth_hint is not None and depth_hint < max_depth:
+        max_depth = max(depth_hint, 0)
 
     if is_debug:
+        print 'pushdown, path prefixes: %s, max depth: %s' % (path_prefixes,
+                                                               max_depth)
         p = {
             'select': s_stmt,
             'order': o_stmt,
@@ -146,77 +378,559 @@ def execute(**kwargs):
                         'select: %s, group by: %s'
                         % (dim_fields, groupby.get_dim_name()))
 
-    # all the files matched to where condition
-    files = []
-    travel_file_tree(f_stmt, w_stmt, files, groupby, 1, max_depth)
+    return {
+        'mode': query_mode,
+        'from': f_stmt,
+        'where': w_stmt,
+        'order': o_stmt,
+        'limit': l_stmt,
+        'show_fields': show_fields,
+        'accu_funcs': accu_funcs,
+        'aliases': aliases,
+        'groupby': groupby,
+        'with_lines': _use_lines(show_fields, accu_funcs, o_stmt, g_stmt),
+        'debug': is_debug,
+        'depth': max_depth,
+        'path_prefixes': path_prefixes,
+        # why the result is partial, None if the travel is completed
+        'partial': None,
+        # stats of the refresh of a view, see 'refresh_view'
+        'view_refresh': None,
+        'exclude': _any_matched(e_stmt.get('exclude')),
+        'prune': _any_matched(e_stmt.get('prune')),
+        'show_border': show_border,
+        # all the files matched to where condition
+        'files': FileRows(_row_stat_fields(show_fields, o_stmt),
+                          _fields_order_cmp(o_stmt['fields']) if o_stmt
+                          else None, sort_buffer * 1024 * 1024),
+    }
+
+
+def walk_queries(root, queries, conf):
+    '''
+        travel root once for all the queries, which are planned by
+        'plan_query' and have the same 'from'
+    '''
+    is_debug = conf.get('debug')
+    max_bytes_read = conf.get('max_bytes_read')
+    io_threads = conf.get('io_threads') or 4
+    one_file_system = conf.get('one_file_system')
+    unique_inodes = conf.get('unique_inodes')
+    engine = conf.get('engine') or 'sync'
+    concurrency = conf.get('concurrency') or 16
+    snapshot = conf.get('snapshot')
+    timeout = conf.get('timeout')
+    max_files = conf.get('max_files')
+
+    # file contents are only read when the query needs them, through a
+    # reader with bounded I/O threads
+    with_lines = any(q['with_lines'] for q in queries)
+    reader = None
+    if with_lines or any(getattr(q['where'], 'cost', 0) for q in queries):
+        reader = ContentReader(max_bytes_read, io_threads, with_lines)
+
+    # the metadata captured by snapshot is used instead of the file system
+    max_depth = max(q['depth'] for q in queries)
+    fs = snapshot if snapshot and snapshot.covers(root, max_depth) else None
+    if is_debug and fs:
+        print 'travel on snapshot: %s' % fs.info()
+
+    # depths of the entries in a columnar snapshot are relative to the
+    # directory it was exported from
+    fanout_root = root
+    if root.startswith(FROM_PREFIX):
+        fs = FqsFs()
+        fanout_root = fs.root(root) or root
+
+    if len(queries) == 1:
+        q = queries[0]
+        ctx = travel_context(root, one_file_system, unique_inodes, fs)
+        walker_args = (q['where'], q['files'], q['groupby'], q['depth'],
+                       reader, ctx)
+        emit = None
+    else:
+        # the inodes are deduplicated by each query
+        ctx = travel_context(root, one_file_system, fs=fs)
+        fanout = QueryFanout(fanout_root, queries, unique_inodes)
+        walker_args = (fanout.select, None, None, max_depth, reader, ctx)
+        emit = fanout.emit
+
+    if timeout:
+        ctx['deadline'] = time.time() + timeout
+    ctx['max_files'] = max_files or 0
+    if conf.get('progress'):
+        ctx['progress'] = Progress(ctx)
+
+    # entries are skipped by the travel only if all the queries exclude or
+    # prune them, the others are filtered for each query by QueryFanout
+    for k in ('exclude', 'prune'):
+        fns = [q[k] for q in queries]
+        if all(fns):
+            ctx[k] = fns[0] if len(fns) == 1 else \
+                lambda f, fns=fns: all(fn(f) for fn in fns)
+    ctx['travel_order'] = conf.get('travel_order') or 'dfs'
+    if conf.get('respect_ignore'):
+        ctx['ignore_files'] = IGNORE_FILES
+    ctx['inode_order'] = bool(conf.get('inode_order'))
+
+    # a directory is pruned if none of the queries can match in it
+    if all(q['path_prefixes'] for q in queries):
+        ctx['path_prefixes'] = [sum((q['path_prefixes'][0] for q in queries),
+                                    ())] if len(queries) > 1 else \
+            queries[0]['path_prefixes']
+
+    if isinstance(fs, FqsFs):
+        walker = FqsWalker(*walker_args, fs=fs, emit=emit)
+    elif engine == 'thread':
+        walker = ThreadedWalker(*walker_args, fs=fs, emit=emit,
+                                concurrency=concurrency)
+    elif engine == 'sync':
+        walker = Walker(*walker_args, fs=fs, emit=emit)
+    else:
+        raise Exception('unknown travel engine: %s' % engine)
+
+    # the travel stops when a budget is exceeded, and the queries output
+    # what have been aggregated
+    try:
+        walker.walk(root)
+    except BudgetExceeded as e:
+        for q in queries:
+            q['partial'] = '%s, %d files travelled' % (e, ctx['files'])
+    finally:
+        if reader:
+            reader.close()
+        if ctx['progress']:
+            ctx['progress'].done()
+
+    skipped = skipped_paths(ctx)
+    if skipped:
+        for q in queries:
+            q['partial'] = '%s; %s' % (q['partial'], skipped) \
+                if q['partial'] else skipped
 
-    # fetch rows
-    order_fn = None
-    if query_mode == MODE_SELECT_FIELDS:
-        rows = files
-        if o_stmt:
-            order_fn = _fields_order_cmp
-    elif query_mode == MODE_SELECT_AGGR:
-        rows = groupby.get_dimension_vals()['*']
+    if is_debug:
+        if reader:
+            print 'content bytes read:', reader.bytes_read()
+        print 'pruned mount points: %d, skipped visited directories: %d, ' \
+            'skipped duplicated inodes: %d' % (ctx['pruned_mounts'],
+                                               ctx['skipped_dirs'],
+                                               ctx['skipped_inodes'])
+        print 'directories pruned by path: %d, entries excluded: %d' % (
+            ctx['pruned_dirs'], ctx['excluded'])
+
+
+def _is_view(kwargs):
+    return bool(kwargs.get('view')) or \
+        kwargs.get('from', '').startswith(VIEW_PREFIX)
+
+
+def run_view(**kwargs):
+    '''
+        execute a statement on the views saved in 'view_store', return the
+        query of the view whose groupby is filled:
+            - create view v as select ...: travel the root and save the
+              partial aggregations of each directory
+            - refresh view v: travel the root again, only the directories
+              changed since the last refresh are listed, see 'ViewWalker'
+            - select * from view v: merge the saved partials, the tree isn't
+              travelled
+    '''
+    store = ViewStore(kwargs.get('view_store'))
+    conf = dict((k, v) for k, v in kwargs.items() if k not in _STMT_KEYS)
+    cmd = kwargs.get('view')
+    if cmd is None:
+        s_stmt = kwargs.get('select') or {'field': {'*': 1}}
+        if s_stmt.get('field', {}).keys() != ['*'] or \
+                any(kwargs.get(k) for k in _STMT_KEYS
+                    if k not in ('select', 'from')):
+            raise Exception('a view is selected by \'select * from view '
+                            '<name>\'')
+
+        view = store.load(kwargs['from'][len(VIEW_PREFIX):])
+        query = _plan_view(view['stmt'], conf, view['depth'])
+        for partials in ordered_partials(view['dirs'], query['from'],
+                                         conf.get('travel_order')):
+            query['groupby'].merge_partials(partials)
+        return query
+
+    if cmd['cmd'] == 'create':
+        view = new_view(cmd['name'], cmd['stmt'], conf.get('depth'))
     else:
-        rows = groupby.get_dimension_rows()
-        if o_stmt:
-            order_fn = _group_order_cmp
+        view = store.load(cmd['name'])
+
+    query = refresh_view(view, conf)
+    store.save(view)
+    return query
+
+
+def refresh_view(view, conf):
+    '''
+        travel the root of the view and update its partials, return the
+        query of the view whose groupby is filled. 'view_refresh' of the
+        query is the stats of the refresh.
+    '''
+    start = time.time()
+    query = _plan_view(view['stmt'], conf, view['depth'])
+    root = query['from']
+
+    ctx = view_context(query, conf)
+    if conf.get('progress'):
+        ctx['progress'] = Progress(ctx)
+
+    walker = ViewWalker(query['where'], query['groupby'], query['depth'],
+                        view['dirs'], ctx)
+    try:
+        walker.walk(root)
+    finally:
+        if ctx['progress']:
+            ctx['progress'].done()
+
+    for partials in ordered_partials(walker.dirs, root,
+                                     ctx['travel_order']):
+        query['groupby'].merge_partials(partials)
+
+    view['dirs'] = walker.dirs
+    view['refreshed'] = time.time()
+    query['view_refresh'] = {
+        'name': view['name'],
+        'dirs': len(walker.dirs),
+        'rescanned': walker.rescanned,
+        'files': ctx['files'],
+        'cost': view['refreshed'] - start,
+    }
+    return query
+
+
+def _plan_view(stmt, conf, depth, kind='view'):
+    '''
+        plan the statement of a view, or a watch with kind 'watch', whose
+        aggregations are updated by the directories changed
+    '''
+    kwargs = parser.parse(stmt)
+    if kwargs is None:
+        raise Exception('failed to parse, statement: %s' % stmt)
 
-    if order_fn:
-        rows.sort(order_fn(o_stmt['fields']))
+    root = kwargs.get('from', '.')
+    if kwargs.get('join') or kwargs.get('view') or kwargs.get('watch') or \
+            root.startswith((FROM_PREFIX, VIEW_PREFIX)):
+        raise Exception('a %s is selected from a directory: %s'
+                        % (kind, stmt))
 
+    kwargs.update(conf)
+    kwargs['depth'] = depth
+    query = plan_query(**kwargs)
+    if query['mode'] == MODE_SELECT_FIELDS:
+        raise Exception('a %s keeps aggregations, fields can\'t be '
+                        'selected: %s' % (kind, stmt))
+    if query['with_lines'] or getattr(query['where'], 'cost', 0):
+        raise Exception('file contents aren\'t supported in %ss: %s'
+                        % (kind, stmt))
+
+    return query
+
+
+def output_view(query):
+    output_query(query)
+    if query['view_refresh']:
+        print format_view_refresh(query['view_refresh'])
+
+
+def format_view_refresh(stats):
+    return 'view %s refreshed in %.3fs, directories: %d, listed: %d, ' \
+        'entries: %d' % (stats['name'], stats['cost'], stats['dirs'],
+                         stats['rescanned'], stats['files'])
+
+
+def run_watch(**kwargs):
+    '''
+        print the aggregations of the statement watched, refreshed every
+        'interval' seconds until interrupted. The first refresh travels the
+        tree, the following ones apply the changes of the directories whose
+        mtime has changed, see 'WatchQuery'.
+    '''
+    conf = dict((k, v) for k, v in kwargs.items() if k not in _STMT_KEYS)
+    # spilled groups can't be retracted
+    conf['group_buffer'] = 0
+    watch = kwargs['watch']
+    query = _plan_view(watch['stmt'], conf, conf.get('depth'), 'watch')
+    watching = WatchQuery(query, conf)
+    try:
+        while True:
+            stats = watching.refresh()
+            output_watch(query, stats)
+            time.sleep(max(watch['interval'] - stats['cost'], 0))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_query(query)
+
+
+def output_watch(query, stats):
+    # the table is redrawn in place on a terminal
+    if sys.stdout.isatty():
+        sys.stdout.write('\x1b[H\x1b[2J')
+    print time.strftime('%Y-%m-%d %H:%M:%S'), query['from']
+    output_query(query)
+    print format_watch_refresh(stats)
+    sys.stdout.flush()
+
+
+def format_watch_refresh(stats):
+    return 'refresh %d in %.3fs, directories: %d, listed: %d, inserted: ' \
+        '%d, deleted: %d, updated: %d, groups recomputed: %d' % (
+            stats['refresh'], stats['cost'], stats['dirs'],
+            stats['rescanned'], stats['inserted'], stats['deleted'],
+            stats['updated'], stats['recomputed'])
+
+
+def output_query(query):
+    query_printer(query).print_table()
+    if query['partial']:
+        print 'PARTIAL RESULT: %s' % query['partial']
+
+
+def close_query(query):
+    '''
+        remove the temporary files of the query
+    '''
+    query['files'].close()
+    query['groupby'].close()
+
+
+def _query_rows(query):
+    '''
+        rows of the query result: FileInfo of the selected files, dict{key
+        -> AccuFuncCls} of the aggregations, or dicts of the groups
+    '''
+    query_mode = query['mode']
+    o_stmt, l_stmt = query['order'], query['limit']
+    groupby = query['groupby']
+
+    s, c = 0, None
     if query_mode != MODE_SELECT_AGGR and l_stmt:
         s, c = (0, l_stmt[0]) if len(l_stmt) == 1 else l_stmt
-        rows = rows[s: s+c]
 
     if query_mode == MODE_SELECT_FIELDS:
-        printer = FieldPrinter(show_fields, rows, aliases, show_border)
+        # sorted when the files are matched
+        rows = query['files'].sorted_rows(s, c)
+    elif query_mode == MODE_SELECT_AGGR:
+        rows = groupby.get_dimension_vals().get('*') or \
+            groupby.empty_row()
+    else:
+        rows = groupby.sorted_rows(_group_order_cmp(o_stmt['fields']) if
+                                   o_stmt else None, s, c)
+
+    if query['debug']:
+        print 'spilled sort runs: %d, groups spilled: %s' % (
+            query['files'].spilled_runs(), groupby.spilled())
+
+    return rows
+
+
+def typed_rows(query):
+    '''
+        return fields and the iterable of rows of the query result, rows are
+        tuples of values without formatting: str for name and path, int for
+        size and lines, float for times, and the values of aggregations.
+        The rows are fetched from the sorted files or groups when they are
+        iterated.
+    '''
+    query_mode = query['mode']
+    accu_keys = [f().key() for f in query['accu_funcs'].values()]
+    dim_names = query['groupby'].get_dim_names()
+
+    if query_mode == MODE_SELECT_FIELDS:
+        show_fields = query['show_fields']
+        fields = ALL_FIELDS if len(show_fields) == 1 and '*' in show_fields \
+            else [f.lower() for f in show_fields]
+    elif query_mode == MODE_SELECT_AGGR:
+        fields = accu_keys
+    else:
+        fields = dim_names + accu_keys
+
+    def typed():
+        rows = _query_rows(query)
+        if query_mode == MODE_SELECT_FIELDS:
+            getters = [_typed_getter(f) for f in fields]
+            for finfo in rows:
+                yield tuple(g(finfo) for g in getters)
+        elif query_mode == MODE_SELECT_AGGR:
+            yield tuple(rows[k].raw_val() for k in accu_keys)
+        else:
+            for r in rows:
+                yield tuple(r[k] for k in dim_names) + \
+                    tuple(r[k].raw_val() for k in accu_keys)
+
+    a = query['aliases']
+    return [a['to_alias'].get(f, f) if a else f for f in fields], typed()
+
+
+def _typed_getter(field):
+    if field == 'name':
+        return lambda finfo: finfo.name
+    elif field == 'path':
+        return lambda finfo: finfo.path
+    elif field == 'size' or field == 'lines':
+        getter = field_getter(field)
+        return lambda finfo: int(getter(finfo))
+
+    getter = field_getter(field)
+    return lambda finfo: float(getter(finfo))
+
+
+def query_printer(query):
+    '''
+        return the printer of the query result
+    '''
+    query_mode = query['mode']
+    groupby = query['groupby']
+    aliases, show_border = query['aliases'], query['show_border']
+    rows = _query_rows(query)
+
+    if query_mode == MODE_SELECT_FIELDS:
+        printer = FieldPrinter(query['show_fields'], rows, aliases,
+                               show_border)
     elif query_mode == MODE_SELECT_AGGR:
-        printer = AggregatePrinter(f_stmt, rows, aliases, show_border)
+        printer = AggregatePrinter(query['from'], rows, aliases, show_border)
     elif query_mode == MODE_GROUP_AGGR:
-        printer = GroupPrinter(rows, groupby.get_dim_name(), accu_funcs,
-                               aliases, show_border)
+        printer = GroupPrinter(rows, groupby.get_dimensions(),
+                               query['accu_funcs'], aliases, show_border)
 
-    printer.print_table()
+    return printer
 
 
-# @param start_point(str)
-# @param selector(func: boolean selector(finfo))
-# @param printer(FieldPrinter)
-# @param files(list of finfo{'name', 'stat'})
-def travel_file_tree(start_point, selector, files, groupby, cur_depth=1,
-                     max_depth=3):
-    if cur_depth > max_depth:
-        return
+class QueryFanout(object):
+    '''
+        Dispatch the files of one travel to several queries. Each query sees
+        the files within its own depth, filtered by its own where condition,
+        exclude and prune. The travel only skips the entries excluded or
+        pruned by all the queries, see 'walk_queries'.
+    '''
+    def __init__(self, root, queries, unique_inodes=False):
+        self._root = root
+        self._queries = queries
+        # path of directory -> depth of its entries
+        self._depths = {}
+        # path of directory -> indexes of the queries which see its entries
+        self._seen_by = {root: range(len(queries))}
+        self._inodes = [set() if unique_inodes else None for q in queries]
+
+    def select(self, finfo, aliases=None):
+        '''
+            return indexes of the queries matched
+        '''
+        depth = self._depth(finfo.path)
+        f = os.path.join(finfo.path, finfo.name)
+        queries = self._queries
+        return [i for i in self._queries_of(finfo.path)
+                if depth <= queries[i]['depth'] and
+                not (queries[i]['exclude'] and queries[i]['exclude'](f)) and
+                queries[i]['where'](finfo, queries[i]['aliases'])]
+
+    def emit(self, finfo, matched):
+        for i in matched:
+            q = self._queries[i]
+            q['files'].append(finfo)
+
+            inodes = self._inodes[i]
+            if inodes is not None:
+                k = (finfo.stat.st_dev, finfo.stat.st_ino)
+                if k in inodes:
+                    continue
+                inodes.add(k)
 
-    g = glob.glob(start_point + '/*')
-    for f in g:
-        statinfo = os.stat(f)
-        fname = os.path.basename(f)
-        finfo = {'name': fname, 'stat': statinfo, 'path': start_point}
-        if selector(finfo, groupby.get_aliases()):
-            files.append(finfo)
+            q['groupby'](finfo)
 
-            groupby(finfo)
+    def _depth(self, path):
+        depth = self._depths.get(path)
+        if depth is None:
+            rel = path[len(self._root):].strip('/')
+            depth = rel.count('/') + 2 if rel else 1
+            self._depths[path] = depth
 
-        if os.path.isdir(f):
-            travel_file_tree(f, selector, files, groupby, cur_depth+1,
-                             max_depth)
+        return depth
+
+    def _queries_of(self, d):
+        '''
+            indexes of the queries which exclude or prune neither d nor the
+            directories between the root and d
+        '''
+        seen_by = self._seen_by.get(d)
+        if seen_by is not None:
+            return seen_by
+
+        # the ancestors not checked yet, without recursion as the tree may
+        # be very deep
+        unchecked = []
+        while d not in self._seen_by and len(d) > len(self._root) and \
+                d != os.path.dirname(d):
+            unchecked.append(d)
+            d = os.path.dirname(d)
+
+        seen_by = self._seen_by.get(d, range(len(self._queries)))
+        for d in reversed(unchecked):
+            seen_by = [i for i in seen_by
+                       if not self._skipped(self._queries[i], d)]
+            self._seen_by[d] = seen_by
+        return seen_by
+
+    @staticmethod
+    def _skipped(query, d):
+        return bool(query['exclude'] and query['exclude'](d) or
+                    query['prune'] and query['prune'](d))
+
+
+def _any_matched(fns):
+    '''
+        return a func matching the paths matched by any of fns, None if fns
+        is empty
+    '''
+    if not fns:
+        return None
+    elif len(fns) == 1:
+        return fns[0]
+    return lambda f: any(fn(f) for fn in fns)
+
+
+def _row_stat_fields(show_fields, o_stmt):
+    '''
+        stats kept in the matched files, which are printed or sorted
+    '''
+    fields = set(ALL_FIELDS if '*' in show_fields else show_fields)
+    if o_stmt:
+        fields.update(o_stmt['fields'].keys())
+
+    return [f for f in fields if f in _STAT_FIELDS]
+
+
+def _use_lines(show_fields, accu_funcs, o_stmt, g_stmt):
+    keys = set(show_fields)
+    keys.update(accu_funcs.keys())
+    if o_stmt:
+        keys.update(o_stmt['fields'].keys())
+    if g_stmt and 'having' in g_stmt:
+        keys.update(g_stmt['having']['aggregations'].keys())
+
+    return any(k == 'lines' or k.endswith('(lines)') for k in keys)
 
 
 def _fields_order_cmp(order_keys):
     def inner_cmp(a, b):
-        # type of a, b is (filename, fstat)
+        # type of a, b is FileInfo
         for k, ad in order_keys.items():
             if k == 'name' or k == 'path':
-                if a[k] == b[k]:
+                vala, valb = getattr(a, k), getattr(b, k)
+                if vala == valb:
+                    continue
+                return cmp(vala, valb) if ad == 'asc' else cmp(valb, vala)
+            elif k == 'lines':
+                vala, valb = content.lines(a), content.lines(b)
+                if vala == valb:
                     continue
-                return cmp(a[k], b[k]) if ad == 'asc' else \
-                    cmp(b[k], a[k])
+                return cmp(vala, valb) if ad == 'asc' else cmp(valb, vala)
             else:
-                vala = int(getattr(a['stat'], 'st_' + k))
-                valb = int(getattr(b['stat'], 'st_' + k))
+                vala = int(getattr(a.stat, 'st_' + k))
+                valb = int(getattr(b.stat, 'st_' + k))
                 if vala == valb:
                     continue
                 return cmp(vala, valb) if ad == 'asc' else cmp(valb, vala)
@@ -253,17 +967,24 @@ def alias_replace(aliases, data_dict):
 
 
 def aggregation_alias_replace(aliases, data_dict, aggr_funcs):
-    for f, data in data_dict.items():
+    # the items are added again to keep the order of the dimensions
+    items = data_dict.items()
+    data_dict.clear()
+    for f, data in items:
         if f in aliases:
             dim_name = aliases[f]
             if not aggr_funcs or dim_name not in aggr_funcs:
                 raise Exception('undefined aggregation alias for %s' % f)
             data_dict[dim_name] = aggr_funcs[dim_name]
-            del(data_dict[f])
+        else:
+            data_dict[f] = data
 
 
 class OuputJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, type(_group_order_cmp)):
             return '%s.%s' % (obj.__module__, obj.func_name)
-        return json.JSONEncoder.default(self, obj)
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        # objects passed by conf, such as snapshot
+        return repr(obj)
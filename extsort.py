@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    extsort
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-20 11:18:52
+
+import sys
+import heapq
+import struct
+import tempfile
+from itertools import chain, islice
+from functools import cmp_to_key
+from fileinfo import FileInfo, stat_record
+
+
+# header of a row: length of name, directory id, lines(-1 if not read)
+_ROW_HEAD = struct.Struct('<HIq')
+
+
+class FileRows(object):
+    '''
+        Matched files of a query. Each file is kept as a FileInfo with the
+        stats in 'fields' only, which are the stats the query prints and
+        sorts.
+
+        If 'mem_budget' bytes is exceeded, the rows in memory are sorted by
+        order_cmp and spilled to a temporary file, and the spilled runs are
+        merged when the rows are fetched. The order is identical to the
+        in-memory sort.
+    '''
+    def __init__(self, fields, order_cmp=None, mem_budget=0):
+        self._stat_cls = stat_record(fields)
+        self._cmp = order_cmp
+        self._budget = mem_budget
+        self._rows = []
+        self._runs = None
+
+        # estimated memory of a row except its name: FileInfo, stat record
+        # and its values, and the slot in list
+        n = len(self._stat_cls._fields)
+        self._row_size = sys.getsizeof(FileInfo('', '', None)) + \
+            sys.getsizeof(self._stat_cls._make([0.0] * n)) + \
+            n * sys.getsizeof(0.0) + sys.getsizeof('') + 8
+        self._mem = 0
+
+    def append(self, finfo):
+        row = finfo.compact(self._stat_cls)
+        self._rows.append(row)
+
+        if self._budget:
+            self._mem += self._row_size + len(row.name)
+            if self._mem > self._budget:
+                self._spill()
+
+    def sorted_rows(self, start=0, count=None):
+        '''
+            return the sorted rows in [start, start + count), a list if no
+            rows are spilled, otherwise an iterable merging the runs
+        '''
+        if self._runs is None:
+            if self._cmp:
+                self._rows.sort(self._cmp)
+            return self._rows[start: None if count is None else start+count]
+
+        if self._rows:
+            self._spill()
+        return self._runs.merged(start, count)
+
+    def spilled_runs(self):
+        return self._runs.count() if self._runs else 0
+
+    def close(self):
+        if self._runs:
+            self._runs.close()
+
+    def _spill(self):
+        if self._cmp:
+            self._rows.sort(self._cmp)
+
+        if self._runs is None:
+            self._runs = SortRuns(self._stat_cls, self._cmp)
+        self._runs.add(self._rows)
+
+        self._rows = []
+        self._mem = 0
+
+
+class RowCodec(object):
+    '''
+        Encode FileInfo with the stats of stat_cls to bytes. The directories
+        are kept in a table in memory, each row refers to its directory by
+        id.
+    '''
+    def __init__(self, stat_cls):
+        self._stat_cls = stat_cls
+        fmt = ''.join('q' if f == 'st_size' else 'd' for f in
+                      stat_cls._fields)
+        self._stat = struct.Struct('<' + fmt)
+        self._dirs = []
+        # directory -> id
+        self._dir_ids = {}
+
+    def encode(self, finfo):
+        dir_id = self._dir_ids.get(finfo.path)
+        if dir_id is None:
+            dir_id = self._dir_ids[finfo.path] = len(self._dirs)
+            self._dirs.append(finfo.path)
+
+        lines = -1 if finfo.lines is None else finfo.lines
+        return _ROW_HEAD.pack(len(finfo.name), dir_id, lines) + finfo.name + \
+            self._stat.pack(*finfo.stat)
+
+    def decode_all(self, f):
+        '''
+            yield all the rows in file f
+        '''
+        head_size, stat_size = _ROW_HEAD.size, self._stat.size
+        while True:
+            head = f.read(head_size)
+            if not head:
+                return
+            name_len, dir_id, lines = _ROW_HEAD.unpack(head)
+            name = f.read(name_len)
+            st = self._stat_cls._make(self._stat.unpack(f.read(stat_size)))
+            yield FileInfo(name, self._dirs[dir_id], st, None,
+                           None if lines == -1 else lines)
+
+
+class SortRuns(object):
+    '''
+        Rows spilled to temporary files. Each run is sorted by order_cmp
+        before it's added, and the runs are merged when they're iterated.
+        Rows with equal keys are returned in the order they were added, as
+        list.sort does.
+    '''
+    def __init__(self, stat_cls, order_cmp=None):
+        self._codec = RowCodec(stat_cls)
+        self._cmp = order_cmp
+        self._runs = []
+
+    def add(self, rows):
+        run = tempfile.NamedTemporaryFile(prefix='fql-sort-')
+        encode = self._codec.encode
+        run.write(''.join(encode(r) for r in rows))
+        run.flush()
+        self._runs.append(run)
+
+    def count(self):
+        return len(self._runs)
+
+    def merged(self, start=0, count=None):
+        '''
+            return the merged rows in [start, start + count), which can be
+            iterated several times
+        '''
+        return _MergedRows(self, start, count)
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+
+    def _iter_runs(self):
+        files = [open(run.name, 'rb') for run in self._runs]
+        try:
+            its = [self._codec.decode_all(f) for f in files]
+            if not self._cmp:
+                for r in chain(*its):
+                    yield r
+                return
+
+            # run index breaks the ties, so the rows with equal keys are
+            # in the order of runs
+            key = cmp_to_key(self._cmp)
+            decorated = [_decorate(key, idx, it) for idx, it in enumerate(its)]
+            for _, _, r in heapq.merge(*decorated):
+                yield r
+        finally:
+            for f in files:
+                f.close()
+
+
+def _decorate(key, idx, rows):
+    for r in rows:
+        yield key(r), idx, r
+
+
+class _MergedRows(object):
+    def __init__(self, runs, start, count):
+        self._runs = runs
+        self._start = start
+        self._end = None if count is None else start + count
+
+    def __iter__(self):
+        return islice(self._runs._iter_runs(), self._start, self._end)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    fileinfo
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-20 09:40:12
+
+from collections import namedtuple
+
+
+class FileInfo(object):
+    '''
+        A file found by the walkers:
+            - name(str): file name
+            - path(str): directory of the file. The walkers pass the same
+              string to all the entries of a directory, so it isn't copied
+              for each file.
+            - stat(os.stat_result or a record of stat_record): file stats,
+              the fields are accessed as 'st_size', 'st_mtime'...
+            - reader(ContentReader): reader of the file contents, None if
+              the query doesn't read contents
+            - lines(int): line count, None until it's read
+            - depth(int): depth in the travel, 1 for the entries of the
+              start point. None if it isn't travelled.
+    '''
+    __slots__ = ('name', 'path', 'stat', 'reader', 'lines', 'depth')
+
+    def __init__(self, name, path, stat, reader=None, lines=None,
+                 depth=None):
+        self.name = name
+        self.path = path
+        self.stat = stat
+        self.reader = reader
+        self.lines = lines
+        self.depth = depth
+
+    def compact(self, stat_cls):
+        '''
+            return a FileInfo which keeps the stats in stat_cls only
+        '''
+        st = self.stat
+        return FileInfo(self.name, self.path,
+                        stat_cls._make([getattr(st, f) for f in
+                                        stat_cls._fields]),
+                        None, self.lines)
+
+
+# tuple of stat fields -> record class
+_stat_records = {}
+
+
+def stat_record(fields):
+    '''
+        return a record class with the stats of fields, such as 'size' and
+        'mtime'. The record is a tuple, which is much smaller than a
+        os.stat_result.
+    '''
+    fields = tuple(sorted(set(fields)))
+    if fields not in _stat_records:
+        _stat_records[fields] = namedtuple('FileStat',
+                                           ['st_' + f for f in fields])
+
+    return _stat_records[fields]
+
@@ -9,22 +9,101 @@
 import cmd
 import sys
 from optparse import OptionParser
-from executor import execute_statement
+from executor import execute_batch, execute_statement, format_view_refresh
+from dbapi import connect
+from snapshot import SnapshotFs
+from print_utils import RowsPrinter, DiffPrinter
+from server import serve, FqlClient
+from treediff import save_snapshot, SnapshotDiff
+from fqs import export_fqs
 
 _fql_version = '0.1.0'
 
 
+def print_result(cursor, stmt):
+    '''
+        execute the statement by the cursor and print the result
+    '''
+    try:
+        cursor.execute(stmt)
+        cursor.printer().print_table()
+        if cursor.partial:
+            print 'PARTIAL RESULT: %s' % cursor.partial
+        if cursor.view_refresh:
+            print format_view_refresh(cursor.view_refresh)
+    finally:
+        cursor.close()
+
+
 class FqlCmd(cmd.Cmd):
     def __init__(self, conf):
         cmd.Cmd.__init__(self)
         self.prompt = 'fql> '
-        self._conf = conf
+        self._conn = connect(**conf)
+        self._conf = self._conn.conf
+        self._cursor = self._conn.cursor()
 
     def do_select(self, arg):
         '''
         use fql to query file infos
         '''
-        execute_statement('select ' + arg, self._conf)
+        print_result(self._cursor, 'select ' + arg)
+
+    def do_create(self, arg):
+        '''
+        create view <name> as select ...: save the aggregations of the
+        statement, which are selected by 'select * from view <name>'
+        '''
+        print_result(self._cursor, 'create ' + arg)
+
+    def do_watch(self, arg):
+        '''
+        watch select ... every 5s: print the aggregations of the statement,
+        updated by the directories changed every interval until Ctrl-C
+        '''
+        execute_statement('watch ' + arg, self._conf)
+
+    def do_refresh(self, arg):
+        '''
+        refresh view <name>: update the view, only the directories changed
+        since the last refresh are listed.
+        refresh: capture the snapshot again
+        '''
+        if arg.strip():
+            print_result(self._cursor, 'refresh ' + arg)
+            return
+
+        snapshot = self._conf.get('snapshot')
+        if not snapshot:
+            print 'no snapshot'
+            return
+
+        snapshot.refresh()
+        self.do_snapshot('')
+
+    def do_snapshot(self, arg):
+        '''
+        snapshot <dir>: capture the metadata of dir in memory, the following
+        selects from dir are executed on the snapshot.
+        snapshot: show the snapshot
+        '''
+        if arg:
+            self._conf['snapshot'] = SnapshotFs(arg.strip(),
+                                                self._conf['depth'],
+                                                self._conf['auto_refresh'])
+
+        snapshot = self._conf.get('snapshot')
+        if not snapshot:
+            print 'no snapshot'
+            return
+
+        info = snapshot.info()
+        print 'snapshot of %s, depth: %d, dirs: %d, entries: %d, age: %.1fs' \
+            % (info['root'], info['depth'], info['dirs'], info['entries'],
+               info['age'])
+        if info['auto_refresh']:
+            print 'auto refresh, directories refreshed: %d' % \
+                info['refreshed_dirs']
 
     def do_exit(self, arg):
         '''
@@ -48,11 +127,96 @@ def opt_parse():
     parser.add_option('-v', '--version', dest='show_version', default=False,
                       help='show version info', action='store_true')
     parser.add_option('-d', '--max-depth', dest='depth', default=3,
-                      type='int', help='max depth to travel')
+                      type='int', help='max depth to travel, 0 means no '
+                      'limit')
+    parser.add_option('-o', '--order', dest='travel_order', default='dfs',
+                      type='choice', choices=['dfs', 'bfs'],
+                      help='travel order: \'dfs\', depth-first, or \'bfs\', '
+                      'breadth-first')
+    parser.add_option('-f', '--file', dest='file', default=None,
+                      help='execute the statements in file, separated by '
+                      '\';\'. Statements from the same directory share one '
+                      'travel')
     parser.add_option('-g', '--debug', dest='debug', default=False,
                       help='show debug information', action='store_true')
     parser.add_option('-b', '--border', dest='border', default=True,
                       help='show table boder or not', action='store_false')
+    parser.add_option('-t', '--timeout', dest='timeout', default=0,
+                      type='int', help='stop the travel after seconds, 0 '
+                      'means no limit')
+    parser.add_option('-m', '--max-files', dest='max_files', default=0,
+                      type='int', help='stop the travel after the number of '
+                      'files, 0 means no limit')
+    parser.add_option('--serve', dest='serve', default=None,
+                      help='run as a server on the Unix domain socket')
+    parser.add_option('--workers', dest='workers', default=4, type='int',
+                      help='max queries executed concurrently by the server')
+    parser.add_option('--max-pending', dest='max_pending', default=64,
+                      type='int', help='max requests waiting or running in '
+                      'the server, the others are rejected')
+    parser.add_option('--connect', dest='connect', default=None,
+                      help='execute the statement by the server on the Unix '
+                      'domain socket')
+    parser.add_option('-s', '--sort-buffer', dest='sort_buffer', default=0,
+                      type='int', help='memory in MB to keep the matched '
+                      'files, the others are sorted and spilled to '
+                      'temporary files. 0 means no limit')
+    parser.add_option('--group-buffer', dest='group_buffer', default=0,
+                      type='int', help='memory in MB to keep the groups of '
+                      'group by, the others are spilled to temporary files. '
+                      '0 means no limit')
+    parser.add_option('--save-snapshot', dest='save_snapshot', default=None,
+                      help='save the metadata of the directory in args to '
+                      'the file, to diff it later')
+    parser.add_option('--export', dest='export', default=None,
+                      help='save the metadata of the directory in args to '
+                      'the columnar snapshot file(.fqs), which is queried by '
+                      '\'from snapshot:file.fqs\'')
+    parser.add_option('--diff', dest='diff', default=None, nargs=2,
+                      metavar='OLD NEW', help='show the changes from the '
+                      'snapshot file OLD to the snapshot file or directory '
+                      'NEW')
+    parser.add_option('--view-store', dest='view_store',
+                      default='~/.fql/views', help='directory of the files '
+                      'of the views created by \'create view\'')
+    parser.add_option('-a', '--auto-refresh', dest='auto_refresh',
+                      default=False, action='store_true',
+                      help='list the directories of the snapshot again if '
+                      'their mtime has changed')
+    parser.add_option('--io-threads', dest='io_threads', default=4,
+                      type='int', help='threads to read file contents')
+    parser.add_option('--max-bytes-read', dest='max_bytes_read', default=0,
+                      type='int', help='stop the travel after reading the '
+                      'bytes of file contents, 0 means no limit')
+    parser.add_option('-x', '--one-file-system', dest='one_file_system',
+                      default=False, action='store_true',
+                      help='don\'t descend directories on other file systems')
+    parser.add_option('-i', '--respect-ignore', dest='respect_ignore',
+                      default=False, action='store_true',
+                      help='skip the entries ignored by .gitignore and '
+                      '.fqlignore files')
+    parser.add_option('-u', '--unique-inodes', dest='unique_inodes',
+                      default=False, action='store_true',
+                      help='aggregate hard links of a file only once')
+    parser.add_option('-e', '--engine', dest='engine', default='sync',
+                      type='choice', choices=['sync', 'thread'],
+                      help='travel engine: \'sync\', or \'thread\' which '
+                      'issues listings and stats concurrently, for high '
+                      'latency file systems')
+    parser.add_option('--inode-order', dest='inode_order', default=False,
+                      action='store_true', help='stat the entries of a '
+                      'directory in the order of their inodes, to reduce '
+                      'seeks on spinning disks. The output order is the '
+                      'same. Needs os.scandir, or the \'scandir\' package '
+                      'on Python 2, and the sync engine, ignored with a '
+                      'warning otherwise')
+    parser.add_option('-j', '--join', dest='join_method', default='hash',
+                      type='choice', choices=['hash', 'merge'],
+                      help='method of join: \'hash\', or \'merge\' which '
+                      'travels the roots in sorted order, only on relpath')
+    parser.add_option('-c', '--concurrency', dest='concurrency', default=16,
+                      type='int', help='max concurrent file system '
+                      'operations of the \'thread\' engine')
 
     return parser.parse_args()
 
@@ -67,10 +231,67 @@ if __name__ == '__main__':
         show_version()
         sys.exit()
 
-    conf = {'depth': opt.depth, 'debug': opt.debug, 'show_border': opt.border}
+    conf = {'depth': opt.depth, 'debug': opt.debug, 'show_border': opt.border,
+            'io_threads': opt.io_threads,
+            'max_bytes_read': opt.max_bytes_read,
+            'one_file_system': opt.one_file_system,
+            'unique_inodes': opt.unique_inodes,
+            'respect_ignore': opt.respect_ignore,
+            'engine': opt.engine, 'concurrency': opt.concurrency,
+            'travel_order': opt.travel_order,
+            'inode_order': opt.inode_order,
+            'join_method': opt.join_method,
+            'auto_refresh': opt.auto_refresh, 'timeout': opt.timeout,
+            'max_files': opt.max_files, 'progress': sys.stderr.isatty(),
+            'sort_buffer': opt.sort_buffer, 'group_buffer': opt.group_buffer,
+            'view_store': opt.view_store}
+
+    if opt.serve:
+        serve(opt.serve, conf, opt.workers, opt.max_pending)
+        sys.exit()
+
+    if opt.connect:
+        c = FqlClient(opt.connect)
+        fields, rows = c.query(' '.join(args), timeout=opt.timeout,
+                               depth=opt.depth, max_files=opt.max_files)
+        c.close()
+        RowsPrinter(fields, rows, opt.border).print_table()
+        if c.partial:
+            print 'PARTIAL RESULT: %s' % c.partial
+        sys.exit()
+
+    if opt.save_snapshot:
+        count = save_snapshot(opt.save_snapshot, args[0] if args else '.',
+                              conf)
+        print 'saved %d entries to %s' % (count, opt.save_snapshot)
+        sys.exit()
+
+    if opt.export:
+        count = export_fqs(opt.export, args[0] if args else '.', conf)
+        print 'exported %d entries to %s' % (count, opt.export)
+        sys.exit()
+
+    if opt.diff:
+        diff = SnapshotDiff(opt.diff[0], opt.diff[1], conf)
+        try:
+            DiffPrinter(diff, opt.border).print_table()
+        finally:
+            diff.close()
+        sys.exit()
+
+    if opt.file:
+        with open(opt.file) as f:
+            stmts = [stmt.strip() for stmt in f.read().split(';')]
+        execute_batch([stmt for stmt in stmts if stmt], conf)
+        sys.exit()
 
     if args:
-        execute_statement(' '.join(args), conf)
+        stmt = ' '.join(args)
+        # watch runs until interrupted instead of returning a result
+        if stmt.split(None, 1)[0].lower() == 'watch':
+            execute_statement(stmt, conf)
+        else:
+            print_result(connect(**conf).cursor(), stmt)
         sys.exit()
 
     c = FqlCmd(conf)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    fqs
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-20 17:02:44
+
+import os
+import mmap
+import struct
+from cStringIO import StringIO
+from fileinfo import FileInfo
+from walker import LocalFs, Walker, travel_context, check_budget, \
+    count_file
+
+
+'''
+columnar snapshot file(.fqs), all the numbers are little endian:
+    header:
+        - magic 'FQS1'
+        - count of entries, count of directories
+        - offset of each column
+    columns of entries, in the order the entries are travelled:
+        - size(int64), mtime, ctime, atime(double), mode(uint32),
+          dev, ino(uint64), depth(uint32), directory id(uint32),
+          name offset(uint32, one more than the entries)
+    columns of directories:
+        - path offset(uint32, one more than the directories)
+    string heaps: names of entries, paths of directories
+
+Opening a file maps it without reading, the pages of a column are loaded
+when a query touches it.
+'''
+
+_MAGIC = 'FQS1'
+
+# column name -> format of an item
+_COLUMNS = [
+    ('size', 'q'), ('mtime', 'd'), ('ctime', 'd'), ('atime', 'd'),
+    ('mode', 'I'), ('dev', 'Q'), ('ino', 'Q'), ('depth', 'I'), ('dir', 'I'),
+    ('name', 'I'), ('dir_path', 'I'), ('name_heap', 'c'), ('dir_heap', 'c'),
+]
+_STAT_COLUMNS = ('size', 'mtime', 'ctime', 'atime', 'mode', 'dev', 'ino')
+_HEAD = struct.Struct('<4sII' + 'Q' * len(_COLUMNS))
+
+# prefix of 'from' to query a columnar snapshot
+FROM_PREFIX = 'snapshot:'
+
+
+class FqsWriter(object):
+    '''
+        keep the columns of the entries emitted by the walkers in memory,
+        and write them to the file when it's closed
+    '''
+    def __init__(self, fpath, root):
+        self._fpath = fpath
+        self._root = root
+        # column name -> bytes of the column
+        self._cols = dict((c, StringIO()) for c, t in _COLUMNS)
+        self._items = dict((c, struct.Struct('<' + t).pack)
+                           for c, t in _COLUMNS)
+        self._count = 0
+        self._dirs = 0
+        # heap -> size
+        self._heap_sizes = {'name_heap': 0, 'dir_heap': 0}
+        # path of directory -> id
+        self._dir_ids = {}
+
+    def emit(self, finfo, matched):
+        '''
+            emit of the walkers
+        '''
+        dir_id = self._dir_ids.get(finfo.path)
+        if dir_id is None:
+            dir_id = self._dir_ids[finfo.path] = self._dirs
+            self._dirs += 1
+            self._append('dir_path', self._add_str('dir_heap', finfo.path))
+
+        rel = finfo.path[len(self._root):].strip('/')
+        for c in _STAT_COLUMNS:
+            self._append(c, getattr(finfo.stat, 'st_' + c))
+        self._append('depth', rel.count('/') + 2 if rel else 1)
+        self._append('dir', dir_id)
+        self._append('name', self._add_str('name_heap', finfo.name))
+        self._count += 1
+
+    def count(self):
+        return self._count
+
+    def close(self):
+        # the end of the last string
+        self._append('name', self._heap_sizes['name_heap'])
+        self._append('dir_path', self._heap_sizes['dir_heap'])
+        datas = [self._cols[c].getvalue() for c, t in _COLUMNS]
+
+        offsets, off = [], _HEAD.size
+        for data in datas:
+            # columns are aligned to 8 bytes
+            off += -off % 8
+            offsets.append(off)
+            off += len(data)
+
+        with open(self._fpath, 'wb') as f:
+            f.write(_HEAD.pack(_MAGIC, self._count, self._dirs, *offsets))
+            for off, data in zip(offsets, datas):
+                f.write('\0' * (off - f.tell()))
+                f.write(data)
+
+    def _append(self, col, val):
+        self._cols[col].write(self._items[col](val))
+
+    def _add_str(self, heap, s):
+        off = self._heap_sizes[heap]
+        self._cols[heap].write(s)
+        self._heap_sizes[heap] += len(s)
+        return off
+
+
+class FqsFile(object):
+    '''
+        a columnar snapshot file mapped in memory
+    '''
+    def __init__(self, fpath):
+        with open(fpath, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        head = _HEAD.unpack_from(self._mm, 0)
+        if head[0] != _MAGIC:
+            self._mm.close()
+            raise Exception('not a columnar snapshot file: %s' % fpath)
+
+        self.fpath = fpath
+        self.count, self.dirs = head[1], head[2]
+        # column name -> (offset, Struct of an item)
+        self._cols = dict((c, (off, struct.Struct('<' + t)))
+                          for (c, t), off in zip(_COLUMNS, head[3:]))
+        # directory id -> path, loaded when the directory is read
+        self._dir_paths = {}
+
+    def value(self, col, idx):
+        off, item = self._cols[col]
+        return item.unpack_from(self._mm, off + idx * item.size)[0]
+
+    def name(self, idx):
+        return self._str('name', 'name_heap', idx)
+
+    def dir_path(self, dir_id):
+        path = self._dir_paths.get(dir_id)
+        if path is None:
+            path = self._dir_paths[dir_id] = self._str('dir_path', 'dir_heap',
+                                                      dir_id)
+        return path
+
+    def root(self):
+        return self.dir_path(0) if self.dirs else None
+
+    def close(self):
+        self._mm.close()
+
+    def _str(self, col, heap, idx):
+        start, end = self.value(col, idx), self.value(col, idx + 1)
+        heap_off = self._cols[heap][0]
+        return self._mm[heap_off + start: heap_off + end]
+
+
+class FqsStat(object):
+    '''
+        stats of an entry in FqsFile, the columns are read when the stats
+        are accessed
+    '''
+    __slots__ = ('_fqs', '_idx')
+
+    def __init__(self, fqs, idx):
+        self._fqs = fqs
+        self._idx = idx
+
+    st_size = property(lambda self: self._fqs.value('size', self._idx))
+    st_mtime = property(lambda self: self._fqs.value('mtime', self._idx))
+    st_ctime = property(lambda self: self._fqs.value('ctime', self._idx))
+    st_atime = property(lambda self: self._fqs.value('atime', self._idx))
+    st_mode = property(lambda self: self._fqs.value('mode', self._idx))
+    st_dev = property(lambda self: self._fqs.value('dev', self._idx))
+    st_ino = property(lambda self: self._fqs.value('ino', self._idx))
+
+
+def export_fqs(fpath, root, conf):
+    '''
+        travel root and save all the entries to the columnar snapshot file,
+        return count of entries
+    '''
+    fs = LocalFs()
+    writer = FqsWriter(fpath, root)
+    ctx = travel_context(root, conf.get('one_file_system'), fs=fs)
+    # depth 0 of conf means no limit
+    Walker(lambda finfo, alias: True, None, None, conf.get('depth') or None,
+           ctx=ctx, fs=fs, emit=writer.emit).walk(root)
+    writer.close()
+
+    return writer.count()
+
+
+class FqsFs(LocalFs):
+    '''
+        file system of 'from snapshot:file.fqs', whose entries are scanned
+        by FqsWalker. Only the snapshot file itself is stat'ed.
+    '''
+    def list(self, d):
+        return []
+
+    def stat(self, f):
+        return os.stat(f[len(FROM_PREFIX):] if f.startswith(FROM_PREFIX)
+                       else f)
+
+    def root(self, start_point):
+        '''
+            directory travelled when the snapshot was exported
+        '''
+        fqs = FqsFile(start_point[len(FROM_PREFIX):])
+        try:
+            return fqs.root()
+        finally:
+            fqs.close()
+
+
+class FqsWalker(Walker):
+    '''
+        Walker on a columnar snapshot. The entries are scanned in the order
+        they were travelled, so the files are returned in the same order as
+        a travel of the live tree.
+    '''
+    # entries selected in a batch, by the I/O threads of reader if any
+    _BATCH = 256
+
+    def __init__(self, selector, files, groupby, max_depth=3, reader=None,
+                 ctx=None, fs=None, emit=None):
+        Walker.__init__(self, selector, files, groupby, max_depth, reader,
+                        ctx, fs or FqsFs(), emit)
+
+    def walk(self, start_point):
+        fqs = FqsFile(start_point[len(FROM_PREFIX):])
+        try:
+            if self._ctx is None:
+                self._ctx = travel_context(start_point, fs=self._fs)
+            # path of directory -> if its entries are skipped
+            self._skipped = {fqs.root(): False}
+            self._scan_fqs(fqs)
+        finally:
+            fqs.close()
+            self.close()
+
+    def _scan_fqs(self, fqs):
+        aliases = self._groupby.get_aliases() if self._groupby else None
+        ctx = self._ctx
+        exclude = ctx['exclude']
+        for start in xrange(0, fqs.count, self._BATCH):
+            check_budget(ctx, fqs.fpath)
+
+            finfos = []
+            for i in xrange(start, min(start + self._BATCH, fqs.count)):
+                depth = fqs.value('depth', i)
+                if depth > self._max_depth:
+                    continue
+                path = fqs.dir_path(fqs.value('dir', i))
+                if self._skipped_dir(path):
+                    continue
+                name = fqs.name(i)
+                if exclude and exclude(os.path.join(path, name)):
+                    continue
+                finfos.append(FileInfo(name, path, FqsStat(fqs, i),
+                                       depth=depth))
+            if self._reader:
+                matched = self._reader.select(self._selector, finfos, aliases)
+            else:
+                matched = (self._selector(finfo, aliases) for finfo in finfos)
+
+            for finfo, m in zip(finfos, matched):
+                count_file(ctx)
+                if m:
+                    self._emit(finfo, m)
+
+    def _skipped_dir(self, d):
+        '''
+            check if the directory is excluded, pruned, or in a skipped
+            directory, as the walkers don't enter it
+        '''
+        # the ancestors not checked yet, without recursion as the tree may
+        # be very deep
+        unchecked = []
+        while d not in self._skipped and d != os.path.dirname(d):
+            unchecked.append(d)
+            d = os.path.dirname(d)
+
+        exclude = self._ctx['exclude']
+        skipped = self._skipped.get(d, False)
+        for d in reversed(unchecked):
+            skipped = skipped or bool(exclude and exclude(d)) or \
+                self._pruned(d) or not self._may_contain(d)
+            self._skipped[d] = skipped
+        return skipped
@@ -6,17 +6,29 @@
 # @author:  chosen0ne(louzhenlin86@126.com)
 # @date:    2015/01/19 22:08:25
 
+import os
 import re
 import time
 import accu_func
+import content
 from datetime import datetime
 from collections import OrderedDict
 from ply import yacc
 from lex_parser import *
+from view import VIEW_PREFIX
 
 
 '''
 grammar:
+    command : statement
+            | CREATE VIEW FNAME AS statement
+            | REFRESH VIEW FNAME
+            | WATCH statement
+            | WATCH statement EVERY interval
+
+    interval : NUMBER
+             | NUMBER FNAME
+
     statement : SELECT select_statement from_statement where_statement
               | SELECT select_statement where_statement
               | SELECT select_statement from_statement
@@ -27,6 +39,7 @@ grammar:
               | statement order_statement
               | statement limit_statement
               | statement group_by_statement
+              | statement exclude_statement
 
     select_statement : select_factor
                      | select_statement ',' select_factor
@@ -35,9 +48,20 @@ grammar:
                   | '*'
                   | accu_func_factor
                   | group_func_factor
-                  | select_factor as FNAME
+                  | FNAME
+                  | select_factor FNAME
+                  | select_factor AS FNAME
 
     from_statement : FROM FNAME
+                   | FROM FNAME join_statement
+                   | FROM VIEW FNAME
+
+    join_statement : JOIN FNAME ON join_key
+                   | LEFT JOIN FNAME ON join_key
+                   | FULL JOIN FNAME ON join_key
+
+    join_key : NAME
+             | FNAME
 
     where_statement : WHERE condition_statement
 
@@ -53,11 +77,13 @@ grammar:
             | CTIME
             | MTIME
             | ATIME
+            | LINES
 
     accu_field : ATIME
                | MTIME
                | CTIME
                | SIZE
+               | LINES
 
     accu_func : AVG
               | MAX
@@ -75,15 +101,29 @@ grammar:
                   | factor
 
     factor : name_factor
+           | path_factor
+           | depth_factor
            | size_factor
            | time_factor
            | alias_factor
+           | join_factor
+           | content_factor
+           | in_factor
            | '(' condition_statement ')'
            | NOT factor
 
     name_factor : NAME '=' QUOTE FNAME QUOTE
                 | NAME NE QUOTE FNAME QUOTE
                 | NAME LIKE QUOTE FNAME QUOTE
+                | NAME '=' PARAM
+                | NAME NE PARAM
+                | NAME LIKE PARAM
+
+    path_factor : PATH '=' QUOTE FNAME QUOTE
+                | PATH NE QUOTE FNAME QUOTE
+                | PATH LIKE QUOTE FNAME QUOTE
+
+    depth_factor : DEPTH cmp_op_sub_factor NUMBER
 
     cmp_op_sub_factor : '='
                       | '>'
@@ -93,6 +133,10 @@ grammar:
                       | LE
 
     size_factor : SIZE cmp_op_sub_factor NUMBER
+                | SIZE cmp_op_sub_factor PARAM
+
+    content_factor : CONTAINS QUOTE FNAME QUOTE
+                   | LINES cmp_op_sub_factor NUMBER
 
     datetime_factor : DATE
                     | DATE TIME
@@ -102,10 +146,17 @@ grammar:
                | ATIME
 
     time_factor : time_field cmp_op_sub_factor datetime_factor
+                | time_field cmp_op_sub_factor PARAM
 
     alias_factor : FNAME cmp_op_sub_factor NUMBER
                  | FNAME cmp_op_sub_factor datetime_factor
 
+    join_factor : FNAME cmp_op_sub_factor FNAME
+
+    in_factor : NAME IN '(' str_list ')'
+              | FTYPE IN '(' str_list ')'
+              | NAME IN FILE '(' QUOTE FNAME QUOTE ')'
+
     order_sub_factor : a_field
                      | accu_func_factor
                      | group_func_factor
@@ -121,6 +172,8 @@ grammar:
                       | MONTH '(' time_field ')'
                       | YEAR '(' time_field ')'
                       | FTYPE
+                      | BUCKET '(' SIZE ',' NUMBER ')'
+                      | LOG2 '(' SIZE ')'
 
     having_statement : HAVING having_condition
 
@@ -134,41 +187,170 @@ grammar:
                       | FNAME
 
     having_factor : having_sub_factor cmp_op_sub_factor NUMBER
+                  | having_sub_factor cmp_op_sub_factor PARAM
                   | '(' having_condition ')'
                   | NOT having_factor
 
-    group_by_statement : GROUP BY group_func_factor
-                       | GROUP BY FNAME
-                       | GROUP BY group_func_factor having_statement
-                       | GROUP BY FNAME having_statement
+    group_by_statement : GROUP BY group_dims
+                       | GROUP BY group_dims having_statement
+
+    group_dims : group_dim
+               | group_dims ',' group_dim
+
+    group_dim : group_func_factor
+              | FNAME
+
+    exclude_statement : EXCLUDE exclude_factor
+                      | PRUNE exclude_factor
+
+    exclude_factor : NAME IN '(' str_list ')'
+                   | NAME LIKE QUOTE FNAME QUOTE
+                   | PATH LIKE QUOTE FNAME QUOTE
+
+    str_list : QUOTE FNAME QUOTE
+             | str_list ',' QUOTE FNAME QUOTE
 
 '''
 
 
+# cost of predicates which read the file contents. Cheaper predicates are
+# always evaluated before them, see 'p_and_condition1'.
+CONTENT_COST = 1
+
+
+def predicate_cost(fn):
+    return getattr(fn, 'cost', 0)
+
+
+def with_cost(fn, cost):
+    if cost:
+        fn.cost = cost
+    return fn
+
+
+def cmp_val(val, num, op):
+    if op == '=':
+        return val == num
+    elif op == '>':
+        return val > num
+    elif op == '<':
+        return val < num
+    elif op == '!=':
+        return val != num
+    elif op == '>=':
+        return val >= num
+    elif op == '<=':
+        return val <= num
+    else:
+        raise Exception('Unsupport operator')
+
+
+def pushdown_hints(fn, p1, p2, op):
+    '''
+        Hints of the files predicate fn can match, which let the walkers
+        skip the subtrees without any match:
+            - 'path_prefixes': list of tuples, the path of a matched file
+              starts with one of the prefixes in each tuple
+            - 'max_depth': matched files are within the depth
+        fn is 'op'('and' or 'or') of predicates p1 and p2.
+    '''
+    prefixes1 = getattr(p1, 'path_prefixes', None)
+    prefixes2 = getattr(p2, 'path_prefixes', None)
+    depth1 = getattr(p1, 'max_depth', None)
+    depth2 = getattr(p2, 'max_depth', None)
+    if op == 'and':
+        prefixes = (prefixes1 or []) + (prefixes2 or [])
+        depth = depth2 if depth1 is None else depth1 if depth2 is None \
+            else min(depth1, depth2)
+    else:
+        prefixes = [prefixes1[0] + prefixes2[0]] if prefixes1 and \
+            prefixes2 else None
+        depth = max(depth1, depth2) if depth1 is not None and \
+            depth2 is not None else None
+
+    if prefixes:
+        fn.path_prefixes = prefixes
+    if depth is not None:
+        fn.max_depth = depth
+    return fn
+
+
+def like_predicate(pattern):
+    '''
+        compile LIKE pattern on file name by its shape, '%' matches any
+        characters:
+            - 'abc': ==
+            - 'abc%': startswith
+            - '%abc': endswith, the suffixes are kept in 'name_suffixes' and
+              merged by OR
+            - '%abc%': in
+            - the others: anchored regex, the literals are escaped
+        The whole name is matched, a trailing '$' is accepted as the end of
+        name.
+    '''
+    if pattern.endswith('$'):
+        pattern = pattern[:-1]
+
+    parts = pattern.split('%')
+    if len(parts) == 1:
+        return lambda finfo, alias: finfo.name == pattern
+
+    literals = [s for s in parts if s]
+    if not literals:
+        return lambda finfo, alias: True
+
+    if len(literals) == 1:
+        lit = literals[0]
+        if parts[0] == lit:
+            return lambda finfo, alias: finfo.name.startswith(lit)
+        elif parts[-1] == lit:
+            return name_suffixes_predicate((lit, ))
+        elif len(parts) == 3:
+            return lambda finfo, alias: lit in finfo.name
+
+    regex = re.compile('.*'.join(re.escape(s) for s in parts) + r'\Z',
+                       re.DOTALL)
+    return lambda finfo, alias: regex.match(finfo.name) is not None
+
+
+def name_suffixes_predicate(suffixes):
+    fn = lambda finfo, alias: finfo.name.endswith(suffixes)
+    fn.name_suffixes = suffixes
+    return fn
+
+
 def fstat_cmp_op(f, val, op):
+    # val is a Param in prepared statements, whose value is bound later
+    param = val if isinstance(val, Param) else None
+
     def fstat_cmp(finfo, alias=None):
         field = alias['from_alias'][f] if alias and f in alias['from_alias'] \
             else f
 
-        stat = int(getattr(finfo['stat'], 'st_' + field))
-        if op == '=':
-            return stat == val
-        elif op == '>':
-            return stat > val
-        elif op == '<':
-            return stat < val
-        elif op == '!=':
-            return stat != val
-        elif op == '>=':
-            return stat >= val
-        elif op == '<=':
-            return stat <= val
-        else:
-            raise Exception('Unsupport operator')
+        stat = int(getattr(finfo.stat, 'st_' + field))
+        return cmp_val(stat, param.value if param else val, op)
 
     return fstat_cmp
 
 
+def to_timestamp(val):
+    '''
+        convert the value bound to a time placeholder: datetime, seconds
+        since epoch, or 'YYYY-mm-dd[ HH:MM:SS]'
+    '''
+    if isinstance(val, datetime):
+        return time.mktime(val.timetuple())
+    elif isinstance(val, (int, long, float)):
+        return val
+
+    fmt = '%Y-%m-%d %H:%M:%S' if ' ' in val else '%Y-%m-%d'
+    return time.mktime(datetime.strptime(val, fmt).timetuple())
+
+
+def to_number(val):
+    return val if isinstance(val, (int, long, float)) else float(val)
+
+
 # used to compare file stats, such as st_size, st_ctime, st_atime...
 fstat_cmp_operators = {
     '=': lambda field, val: fstat_cmp_op(field, val, '='),
@@ -182,22 +364,51 @@ fstat_cmp_operators = {
 
 time_aggregate_operators = {
     'minute': lambda field: lambda finfo: datetime.fromtimestamp(
-        getattr(finfo['stat'], field)).strftime('%Y-%m-%d %H:%M'),
+        getattr(finfo.stat, field)).strftime('%Y-%m-%d %H:%M'),
     'hour': lambda field: lambda finfo: datetime.fromtimestamp(
-        getattr(finfo['stat'], field)).strftime('%Y-%m-%d %H'),
+        getattr(finfo.stat, field)).strftime('%Y-%m-%d %H'),
     'day': lambda field: lambda finfo: datetime.fromtimestamp(
-        getattr(finfo['stat'], field)).strftime('%Y-%m-%d'),
+        getattr(finfo.stat, field)).strftime('%Y-%m-%d'),
     'month': lambda field: lambda finfo: datetime.fromtimestamp(
-        getattr(finfo['stat'], field)).strftime('%Y-%m'),
+        getattr(finfo.stat, field)).strftime('%Y-%m'),
     'year': lambda field: lambda finfo: datetime.fromtimestamp(
-        getattr(finfo['stat'], field)).strftime('%Y'),
+        getattr(finfo.stat, field)).strftime('%Y'),
 }
 
 
 # fetch file type '.*$'
 def ftype_aggregate_operator(finfo):
-    idx = finfo['name'].rfind('.')
-    return finfo['name'][idx:] if idx != -1 else '$'
+    idx = finfo.name.rfind('.')
+    return finfo.name[idx:] if idx != -1 else '$'
+
+
+# The dimensions of size are ints, so the groups are ordered by size and
+# merged without parsing strings. 'size_range' of the dimension returns the
+# sizes [low, high) of a group, which are shown by 'GroupPrinter'.
+def bucket_aggregate_operator(width):
+    '''
+        lower bound of the bucket of 'width' bytes which the size is in
+    '''
+    fn = lambda finfo: finfo.stat.st_size // width * width
+    fn.size_range = lambda low: (low, low + width)
+    return fn
+
+
+def log2_aggregate_operator(finfo):
+    '''
+        floor of log2 of the size, -1 for empty files
+    '''
+    return int(finfo.stat.st_size).bit_length() - 1
+
+log2_aggregate_operator.size_range = lambda k: (0, 1) if k < 0 else \
+    (1 << k, 1 << k + 1)
+
+
+def size_literal(size):
+    for unit in ('T', 'G', 'M', 'K'):
+        if size and size % SIZE_UNITS[unit] == 0:
+            return '%d%s' % (size // SIZE_UNITS[unit], unit)
+    return str(size)
 
 
 def check_order_stmt(stmts, order_stmt):
@@ -241,6 +452,102 @@ def check_select_stmt(stmts):
                         ' same time')
 
 
+# fields of the entries selected outside join, see 'p_a_field'
+SELECT_FIELDS = ('name', 'path', 'size', 'ctime', 'mtime', 'atime', 'lines')
+
+# fields of the entries of a join, 'a.' for the left root and 'b.' for the
+# right root
+JOIN_FIELDS = ('name', 'path', 'size', 'ctime', 'mtime', 'atime', 'depth')
+JOIN_KEYS = ('relpath', 'name')
+
+
+def join_field(f):
+    '''
+        return (side, field) of 'a.size' or 'b.size', side is 0 for the
+        left root and 1 for the right root. None if f isn't a field of the
+        joined entries.
+    '''
+    side, dot, field = f.partition('.')
+    if not dot or side not in ('a', 'b') or field not in JOIN_FIELDS:
+        return None
+    return (0 if side == 'a' else 1), field
+
+
+def check_join_stmt(stmts):
+    select_stmt = stmts.get('select', {})
+    fields = select_stmt.get('field', {}).keys()
+    if 'join' not in stmts:
+        for f in fields:
+            if f == 'relpath' or join_field(f):
+                raise Exception('\'%s\' can only be selected in join' % f)
+            if f != '*' and f not in SELECT_FIELDS:
+                raise Exception('unknown field: %s, the fields are %s'
+                                % (f, ', '.join(SELECT_FIELDS)))
+        return
+
+    for f in fields:
+        if f not in ('*', 'relpath') and not join_field(f):
+            raise Exception('unknown field of join: %s, the fields are '
+                            '\'relpath\', \'a.<field>\' and \'b.<field>\''
+                            % f)
+    for k in ('aggregations', 'dimension_aggr'):
+        if k in select_stmt:
+            raise Exception('aggregations aren\'t supported in join')
+    for k in ('order', 'group'):
+        if k in stmts:
+            raise Exception('\'%s by\' isn\'t supported in join' % k)
+
+
+# seconds between the refreshes of 'watch' without 'every'
+WATCH_INTERVAL = 5
+_INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+start = 'command'
+
+
+def p_command(p):
+    '''
+        command : statement
+                | CREATE VIEW FNAME AS statement
+                | REFRESH VIEW FNAME
+    '''
+    if len(p) == 2:
+        p[0] = p[1]
+    elif len(p) == 4:
+        p[0] = {'view': {'cmd': 'refresh', 'name': p[3]}}
+    else:
+        # the statement is saved as text, and parsed again when the view is
+        # refreshed
+        stmt = p.lexer.lexdata[p.lexpos(4) + len(p[4]):].strip()
+        p[0] = {'view': {'cmd': 'create', 'name': p[3], 'stmt': stmt}}
+
+
+def p_watch_command(p):
+    '''
+        command : WATCH statement
+                | WATCH statement EVERY interval
+    '''
+    # the statement is saved as text and planned again, as a view
+    end = p.lexpos(3) if len(p) == 5 else len(p.lexer.lexdata)
+    stmt = p.lexer.lexdata[p.lexpos(1) + len(p[1]):end].strip()
+    p[0] = {'watch': {'stmt': stmt,
+                      'interval': p[4] if len(p) == 5 else WATCH_INTERVAL}}
+
+
+def p_interval(p):
+    '''
+        interval : NUMBER
+                 | NUMBER FNAME
+    '''
+    unit = p[2] if len(p) == 3 else 's'
+    if unit not in _INTERVAL_UNITS:
+        raise Exception('invalid unit of interval: %s, expect s, m or h'
+                        % unit)
+
+    p[0] = p[1] * _INTERVAL_UNITS[unit]
+
+
 def p_statement(p):
     '''
         statement : SELECT select_statement from_statement where_statement
@@ -253,6 +560,7 @@ def p_statement(p):
                   | statement order_statement
                   | statement limit_statement
                   | statement group_by_statement
+                  | statement exclude_statement
     '''
     if isinstance(p[1], dict):
         # statement : ^statement.*
@@ -293,8 +601,19 @@ def p_statement(p):
             check_group_stmt(stmts, p[2][1])
 
             stmts['group'] = p[2][1]
+        elif stmt_type in ('exclude', 'prune'):
+            # statement : statement exclude_statement
+            excludes = stmts.setdefault('exclude', {'exclude': [],
+                                                    'prune': []})
+            excludes[stmt_type].append(stmt)
+
+    # statement : SELECT ... from_statement join_statement ...
+    for part in p[2:]:
+        if isinstance(part, tuple) and part[0] == 'from' and len(part) == 3:
+            stmts['join'] = part[2]
 
     check_select_stmt(stmts)
+    check_join_stmt(stmts)
 
 
 def p_select_stmt(p):
@@ -334,14 +653,19 @@ def p_select_factor(p):
                       | '*'
                       | accu_func_factor
                       | group_func_factor
+                      | FNAME
                       | select_factor FNAME
+                      | select_factor AS FNAME
     '''
+    # FNAME: 'relpath' or 'a.size', fields of join
     if isinstance(p[1], str):
         p[0] = ('field', (p[1], 1))
-    elif len(p) == 3:
+    elif len(p) > 2:
+        # the alias is the last symbol, after AS if any
+        name = p[len(p) - 1]
         alias = {
-            'from_alias': {p[2]: p[1][1][0]},
-            'to_alias': {p[1][1][0]: p[2]},
+            'from_alias': {name: p[1][1][0]},
+            'to_alias': {p[1][1][0]: name},
             'factor': p[1]
         }
         p[0] = ('alias', alias)
@@ -357,6 +681,7 @@ def p_a_field(p):
                 | CTIME
                 | MTIME
                 | ATIME
+                | LINES
     '''
     p[0] = p[1].lower()
 
@@ -367,6 +692,7 @@ def p_accu_field(p):
                    | MTIME
                    | CTIME
                    | SIZE
+                   | LINES
     '''
     p[0] = p[1]
 
@@ -392,8 +718,9 @@ def p_accu_func_factor(p):
     field = p[field_idx].lower()
     fn = p[fn_idx]
 
-    if fn == 'sum' and field != 'size':
-        raise Exception('\'sum\' can only be operated on \'size\'')
+    if fn == 'sum' and field not in ('size', 'lines'):
+        raise Exception('\'sum\' can only be operated on \'size\' or '
+                        '\'lines\'')
 
     accu_obj_name = '%s%sFuncCls' % (fn[0].upper(), fn[1:].lower())
     accu_obj = accu_func.__dict__[accu_obj_name]
@@ -403,8 +730,46 @@ def p_accu_func_factor(p):
 
 
 def p_from_stmt(p):
-    'from_statement : FROM FNAME'
-    p[0] = ('from', p[2])
+    '''
+        from_statement : FROM FNAME
+                       | FROM FNAME join_statement
+                       | FROM VIEW FNAME
+    '''
+    if len(p) == 3:
+        p[0] = ('from', p[2])
+    elif p[2].lower() == 'view':
+        p[0] = ('from', VIEW_PREFIX + p[3])
+    else:
+        # the left root is 'from' of the statement
+        p[0] = ('from', p[2], p[3])
+
+
+def p_join_statement(p):
+    '''
+        join_statement : JOIN FNAME ON join_key
+                       | LEFT JOIN FNAME ON join_key
+                       | FULL JOIN FNAME ON join_key
+    '''
+    # entries of the roots are joined by 'relpath', the path relative to
+    # the root, or 'name'. 'inner' returns the matched entries, 'left' adds
+    # the entries only in the left root, and 'full' adds the entries only
+    # in either root.
+    if len(p) == 5:
+        how, root, key = 'inner', p[2], p[4]
+    else:
+        how, root, key = p[1].lower(), p[3], p[5]
+
+    if key not in JOIN_KEYS:
+        raise Exception('join on \'relpath\' or \'name\', not: %s' % key)
+    p[0] = {'how': how, 'root': root, 'key': key}
+
+
+def p_join_key(p):
+    '''
+        join_key : NAME
+                 | FNAME
+    '''
+    p[0] = p[1].lower()
 
 
 def p_where_stmt(p):
@@ -415,7 +780,17 @@ def p_where_stmt(p):
 def p_condition_stmt1(p):
     'condition_statement : condition_statement OR and_condition'
     p1, p2 = p[1], p[3]
-    p[0] = lambda finfo, alias: p1(finfo, alias) or p2(finfo, alias)
+    if hasattr(p1, 'name_suffixes') and hasattr(p2, 'name_suffixes'):
+        # name like '%.log' or name like '%.gz' => one tuple endswith
+        p[0] = name_suffixes_predicate(p1.name_suffixes + p2.name_suffixes)
+        return
+
+    c1, c2 = predicate_cost(p1), predicate_cost(p2)
+    if c1 > c2:
+        p1, p2 = p2, p1
+    fn = with_cost(lambda finfo, alias: p1(finfo, alias) or
+                   p2(finfo, alias), max(c1, c2))
+    p[0] = pushdown_hints(fn, p1, p2, 'or')
 
 
 def p_condition_stmt2(p):
@@ -426,7 +801,12 @@ def p_condition_stmt2(p):
 def p_and_condition1(p):
     'and_condition : and_condition AND factor'
     p1, p2 = p[1], p[3]
-    p[0] = lambda finfo, alias: p1(finfo, alias) and p2(finfo, alias)
+    c1, c2 = predicate_cost(p1), predicate_cost(p2)
+    if c1 > c2:
+        p1, p2 = p2, p1
+    fn = with_cost(lambda finfo, alias: p1(finfo, alias) and
+                   p2(finfo, alias), max(c1, c2))
+    p[0] = pushdown_hints(fn, p1, p2, 'and')
 
 
 def p_and_condition2(p):
@@ -437,9 +817,14 @@ def p_and_condition2(p):
 def p_factor(p):
     '''
         factor : name_factor
+               | path_factor
+               | depth_factor
                | size_factor
                | time_factor
                | alias_factor
+               | join_factor
+               | content_factor
+               | in_factor
                | '(' condition_statement ')'
                | NOT factor
     '''
@@ -447,7 +832,8 @@ def p_factor(p):
         p[0] = p[1]
     elif len(p) == 3:
         p1 = p[2]
-        p[0] = lambda finfo, alias: not p1(finfo, alias)
+        p[0] = with_cost(lambda finfo, alias: not p1(finfo, alias),
+                         predicate_cost(p1))
     elif len(p) == 4:
         p[0] = p[2]
 
@@ -457,17 +843,81 @@ def p_name_factor(p):
         name_factor : NAME '=' QUOTE FNAME QUOTE
                     | NAME NE QUOTE FNAME QUOTE
                     | NAME LIKE QUOTE FNAME QUOTE
+                    | NAME '=' PARAM
+                    | NAME NE PARAM
+                    | NAME LIKE PARAM
     '''
+    if len(p) == 4:
+        name_param_factor(p)
+        return
+
     _, _, op, _, fname, _ = p
     if op == '=':
-        p[0] = lambda finfo, alias: finfo['name'] == fname
+        p[0] = lambda finfo, alias: finfo.name == fname
     elif op == '!=':
-        p[0] = lambda finfo, alias: finfo['name'] != fname
+        p[0] = lambda finfo, alias: finfo.name != fname
     else:
-        fname = fname.replace('.', '\.')
-        fname = fname.replace('%', '.*')
-        pattern = re.compile(fname)
-        p[0] = lambda finfo, alias: pattern.match(finfo['name']) is not None
+        p[0] = like_predicate(fname)
+
+
+def name_param_factor(p):
+    _, _, op, param = p
+    if op == '=':
+        param.convert = str
+        p[0] = lambda finfo, alias: finfo.name == param.value
+    elif op == '!=':
+        param.convert = str
+        p[0] = lambda finfo, alias: finfo.name != param.value
+    else:
+        # the pattern is compiled once when it's bound
+        param.convert = like_predicate
+        p[0] = lambda finfo, alias: param.value(finfo, alias)
+
+
+def p_path_factor(p):
+    '''
+        path_factor : PATH '=' QUOTE FNAME QUOTE
+                    | PATH NE QUOTE FNAME QUOTE
+                    | PATH LIKE QUOTE FNAME QUOTE
+    '''
+    _, _, op, _, path, _ = p
+    if op == '=':
+        fn = lambda finfo, alias: finfo.path == path
+        fn.path_prefixes = [(path, )]
+        p[0] = fn
+    elif op == '!=':
+        p[0] = lambda finfo, alias: finfo.path != path
+    else:
+        name_fn = like_predicate(path)
+        fn = lambda finfo, alias: name_fn(_Named(finfo.path), alias)
+        # literal before the first '%'
+        prefix = path.rstrip('$').split('%')[0]
+        if prefix:
+            fn.path_prefixes = [(prefix, )]
+        p[0] = fn
+
+
+class _Named(object):
+    '''
+        matches other strings by the LIKE predicates on name
+    '''
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        self.name = name
+
+
+def p_depth_factor(p):
+    '''
+        depth_factor : DEPTH cmp_op_sub_factor NUMBER
+    '''
+    _, _, op, depth = p
+    fn = lambda finfo, alias: cmp_val(finfo.depth, depth, op)
+    if op == '=' or op == '<=':
+        fn.max_depth = depth
+    elif op == '<':
+        fn.max_depth = depth - 1
+    p[0] = fn
 
 
 def p_num_cmp_sub_factor(p):
@@ -485,12 +935,30 @@ def p_num_cmp_sub_factor(p):
 def p_size_factor(p):
     '''
         size_factor : SIZE cmp_op_sub_factor NUMBER
+                    | SIZE cmp_op_sub_factor PARAM
     '''
     _, _, op, fsize = p
+    if isinstance(fsize, Param):
+        fsize.convert = int
     cmp_func = fstat_cmp_operators[op]
     p[0] = cmp_func('size', fsize)
 
 
+def p_content_factor(p):
+    '''
+        content_factor : CONTAINS QUOTE FNAME QUOTE
+                       | LINES cmp_op_sub_factor NUMBER
+    '''
+    if len(p) == 5:
+        literal = p[3]
+        fn = lambda finfo, alias: content.contains(finfo, literal)
+    else:
+        _, _, op, num = p
+        fn = lambda finfo, alias: cmp_val(content.lines(finfo), num, op)
+
+    p[0] = with_cost(fn, CONTENT_COST)
+
+
 def p_datetime_factor(p):
     '''
         datetime_factor : DATE
@@ -514,6 +982,7 @@ def p_time_field(p):
 def p_time_factor(p):
     '''
         time_factor : time_field cmp_op_sub_factor datetime_factor
+                    | time_field cmp_op_sub_factor PARAM
     '''
     time_proc(p)
 
@@ -528,9 +997,67 @@ def p_alias_factor(p):
     if not isinstance(val, int):
         val = time.mktime(val.timetuple())
 
+    field = join_field(f)
+    if field:
+        # 'a.size > 1024' in join
+        p[0] = lambda row, alias: cmp_join(row.value(*field), val, op)
+        return
+
     p[0] = cmp_func(f, val)
 
 
+def p_join_factor(p):
+    '''
+        join_factor : FNAME cmp_op_sub_factor FNAME
+    '''
+    _, f1, op, f2 = p
+    field1, field2 = join_field(f1), join_field(f2)
+    if not field1 or not field2:
+        raise Exception('unknown fields of join: %s %s %s' % (f1, op, f2))
+
+    p[0] = lambda row, alias: cmp_join(row.value(*field1),
+                                       row.value(*field2), op)
+
+
+def p_in_factor(p):
+    '''
+        in_factor : NAME IN '(' str_list ')'
+                  | FTYPE IN '(' str_list ')'
+                  | NAME IN FILE '(' QUOTE FNAME QUOTE ')'
+    '''
+    # the values are hashed once, a file is matched by one lookup however
+    # long the list is
+    if len(p) == 9:
+        values = read_names(p[6])
+    else:
+        values = frozenset(p[4])
+
+    if p[1].lower() == 'ftype':
+        p[0] = lambda finfo, alias: ftype_aggregate_operator(finfo) in values
+    else:
+        p[0] = lambda finfo, alias: finfo.name in values
+
+
+def read_names(fpath):
+    '''
+        names in file, one per line, the blank lines are skipped
+    '''
+    with open(fpath) as f:
+        return frozenset(line.rstrip('\r\n') for line in f
+                         if line.strip())
+
+
+def cmp_join(val1, val2, op):
+    '''
+        the fields of the entry missing in a root are None, they are only
+        different to the fields of the other entry. So 'b.size != a.size'
+        matches the entries missing in b or different in size.
+    '''
+    if val1 is None or val2 is None:
+        return op == '!=' and val1 is not val2
+    return cmp_val(val1, val2, op)
+
+
 def p_order_statement(p):
     '''
         order_statement : ORDER BY order_factor
@@ -609,8 +1136,18 @@ def p_group_func_factor(p):
                           | MONTH '(' time_field ')'
                           | YEAR '(' time_field ')'
                           | FTYPE
+                          | BUCKET '(' SIZE ',' NUMBER ')'
+                          | LOG2 '(' SIZE ')'
     '''
-    if len(p) == 5:
+    if len(p) == 7:
+        width = p[5]
+        if width <= 0:
+            raise Exception('width of bucket must be positive: %d' % width)
+        k = 'bucket(size, %s)' % size_literal(width)
+        p[0] = ('dimension_aggr', (k, bucket_aggregate_operator(width)))
+    elif p[1].lower() == 'log2':
+        p[0] = ('dimension_aggr', ('log2(size)', log2_aggregate_operator))
+    elif len(p) == 5:
         k = '%s(%s)' % (p[1].lower(), p[3])
         fn = time_aggregate_operators[p[1].lower()]
         p[0] = ('dimension_aggr', (k, fn('st_' + p[3])))
@@ -663,6 +1200,7 @@ def p_having_sub_factor(p):
 def p_having_factor(p):
     '''
         having_factor : having_sub_factor cmp_op_sub_factor NUMBER
+                      | having_sub_factor cmp_op_sub_factor PARAM
                       | '(' having_condition ')'
                       | NOT having_factor
     '''
@@ -687,7 +1225,11 @@ def p_having_factor(p):
             p[0] = {'aggregations': {p[1][1]: 1}}
             aggr_func_key = p[1][1]
 
-        if op == '=':
+        if isinstance(num, Param):
+            num.convert = to_number
+            p[0]['fn'] = lambda having_data: cmp_val(
+                having_data[aggr_func_key], num.value, op)
+        elif op == '=':
             p[0]['fn'] = lambda having_data: having_data[aggr_func_key] == num
         elif op == '!=':
             p[0]['fn'] = lambda having_data: having_data[aggr_func_key] != num
@@ -703,15 +1245,13 @@ def p_having_factor(p):
 
 def p_group_by_statemennt(p):
     '''
-        group_by_statement : GROUP BY group_func_factor
-                           | GROUP BY FNAME
-                           | GROUP BY group_func_factor having_statement
-                           | GROUP BY FNAME having_statement
+        group_by_statement : GROUP BY group_dims
+                           | GROUP BY group_dims having_statement
     '''
     # structure of p[0](dict, group result):
-    #   'dimension_aggr'(dict: str -> func):
-    #       'ftype': str fun(finfo{'name', 'stat'})
-    #       'minute(ctime)': str func(finfo{'name', 'stat'})
+    #   'dimension_aggr'(OrderedDict: str -> func), in the order of group by:
+    #       'ftype': str fun(finfo(FileInfo))
+    #       'minute(ctime)': str func(finfo(FileInfo))
     #       ...
     #   'having'(dict):
     #       'aggregations': OrderedDict(aggr_key -> AccuFuncCls)
@@ -721,17 +1261,85 @@ def p_group_by_statemennt(p):
     p[0] = ('group', {})
 
     g = p[0][1]
-    if isinstance(p[3], str):
-        p[3] = ('', (p[3], 1))
-
-    g['dimension_aggr'] = OrderedDict([p[3][1]])
+    g['dimension_aggr'] = p[3]
     if len(p) == 5:
         g['having'] = p[4]
 
 
+def p_group_dims(p):
+    '''
+        group_dims : group_dim
+                   | group_dims ',' group_dim
+    '''
+    if len(p) == 2:
+        p[0] = OrderedDict()
+        k, fn = p[1]
+    else:
+        p[0] = p[1]
+        k, fn = p[3]
+
+    if k in p[0]:
+        raise Exception('Duplicated dimension of group by: %s' % k)
+    p[0][k] = fn
+
+
+def p_group_dim(p):
+    '''
+        group_dim : group_func_factor
+                  | FNAME
+    '''
+    # FNAME is an alias of the dimension in select, replaced by the planner
+    p[0] = (p[1], 1) if isinstance(p[1], str) else p[1][1]
+
+
+def p_exclude_statement(p):
+    '''
+        exclude_statement : EXCLUDE exclude_factor
+                          | PRUNE exclude_factor
+    '''
+    # exclude: the matched entries are skipped before they are stat'ed
+    # prune: the matched directories are selected, but not travelled
+    p[0] = (p[1].lower(), p[2])
+
+
+def p_exclude_factor(p):
+    '''
+        exclude_factor : NAME IN '(' str_list ')'
+                       | NAME LIKE QUOTE FNAME QUOTE
+                       | PATH LIKE QUOTE FNAME QUOTE
+    '''
+    # the factor is matched with the path of an entry in the travel, which is
+    # the 'path' of the entries in it if it's a directory
+    if p[2].lower() == 'in':
+        names = frozenset(p[4])
+        p[0] = lambda f: os.path.basename(f) in names
+        return
+
+    fn = like_predicate(p[4])
+    if p[1].lower() == 'name':
+        p[0] = lambda f: fn(_Named(os.path.basename(f)), None)
+    else:
+        p[0] = lambda f: fn(_Named(f), None)
+
+
+def p_str_list(p):
+    '''
+        str_list : QUOTE FNAME QUOTE
+                 | str_list ',' QUOTE FNAME QUOTE
+    '''
+    if len(p) == 4:
+        p[0] = [p[2]]
+    else:
+        p[0] = p[1]
+        p[0].append(p[4])
+
+
 def time_proc(p):
     _, field_name, op, d = p
-    d = time.mktime(d.timetuple())
+    if isinstance(d, Param):
+        d.convert = to_timestamp
+    else:
+        d = time.mktime(d.timetuple())
     field_name = field_name.lower()
 
     cmp_func = fstat_cmp_operators[op]
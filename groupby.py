@@ -6,14 +6,26 @@
 # @author:  chosen0ne(louzhenlin86@126.com)
 # @date:    2019-05-16 11:04:32
 
+import sys
+import heapq
+import tempfile
+import cPickle as pickle
+from itertools import islice
+from functools import cmp_to_key
 from collections import OrderedDict
 
 
+# groups are spilled to the partitions by hash of the dimension
+_PARTITIONS = 32
+
+
 class GroupBy(object):
     def __init__(self, **kwargs):
+        self._kwargs = kwargs
         accu_funcs = kwargs.get('accu_funcs', {})
         having = kwargs.get('having')
-        # dict: dimension name -> str func(finfo{'name', {'stat'}})
+        # dict: dimension name -> func(finfo(FileInfo)), which returns str,
+        # or int for the dimensions of size
         # support multiple dimensions
         self._dimensions = kwargs.get('dimension_aggr')
         self._aliases = kwargs.get('aliases')
@@ -38,21 +50,44 @@ class GroupBy(object):
         # OrderedDict: dimension(str) -> dict{aggr func key -> AccuFuncCls}
         self._dimension_accufuncs = OrderedDict()
 
-        self._dim_name = '&'.join([n for n in self._dimensions.keys()])
+        self._dim_names = self._dimensions.keys()
+        self._dim_name = '&'.join(self._dim_names)
+        # the group of a file is keyed by the value of a single dimension,
+        # or the tuple of the values of multiple dimensions
+        if len(self._dimensions) == 1:
+            self._dim_fn = self._dimensions.values()[0]
+        else:
+            dim_fns = self._dimensions.values()
+            self._dim_fn = lambda finfo: tuple([d(finfo) for d in dim_fns])
+
+        # memory in bytes to keep the groups, the groups beyond it are
+        # spilled to the partitions on disk. 0 means no limit.
+        self._mem_budget = kwargs.get('mem_budget') or 0
+        self._mem = 0
+        # estimated memory of a group except its dimension
+        self._group_size = None
+        # dimension -> sequence when it's first seen, only kept with budget.
+        # The groups merged from the partitions are in this order.
+        self._seqs = {}
+        self._seq = 0
+        # temporary files, None if no groups are spilled
+        self._partitions = None
+        self._accu_keys = None
 
     def __call__(self, finfo):
-        dim_val = '&'.join([d(finfo) for d in self._dimensions.values()])
+        dim_val = self._dim_fn(finfo)
 
-        dim_val.strip()
         if dim_val not in self._dimension_accufuncs:
-            self._dimension_accufuncs[dim_val] = OrderedDict()
-            for f in self._accu_func_creators:
-                fn = f()
-                self._dimension_accufuncs[dim_val][fn.key()] = fn
+            self._dimension_accufuncs[dim_val] = self._new_row()
+            if self._mem_budget:
+                self._add_mem(dim_val)
 
-        for f in self._dimension_accufuncs[dim_val].values():
+        for f in self._accu_fns(self._dimension_accufuncs[dim_val]):
             f(finfo)
 
+        if self._mem_budget and self._mem > self._mem_budget:
+            self._spill()
+
     def get_dimension_vals(self):
         if self._accu_selector is None:
             return self._dimension_accufuncs
@@ -78,25 +113,251 @@ class GroupBy(object):
         '''
         rows = []
         for d, acc_vals_row in self._dimension_accufuncs.items():
-            # add aliases
-            if self._aliases:
-                for k, acc_fn in acc_vals_row.items():
-                    if k in self._aliases['to_alias']:
-                        acc_vals_row[self._aliases['to_alias'][k]] = acc_fn
-
-            if not self._accu_selector or \
-                    self._accu_selector(dict([(k, fn.val()) for k, fn in
-                                              acc_vals_row.items()])):
-                acc_vals_row[self._dim_name] = d
+            if self._select_row(d, acc_vals_row):
                 rows.append(acc_vals_row)
 
         return rows
 
+    def sorted_rows(self, order_cmp=None, start=0, count=None):
+        '''
+            return the rows in [start, start + count) sorted by order_cmp,
+            rows with equal keys are in the order they're first seen.
+            A list if no groups are spilled, otherwise an iterable merging
+            the partitions, which can be iterated several times.
+        '''
+        end = None if count is None else start + count
+        if self._partitions is None:
+            rows = self.get_dimension_rows()
+            if order_cmp:
+                rows.sort(order_cmp)
+            return rows[start: end]
+
+        self._spill()
+
+        # merge the groups partition by partition, the selected rows of each
+        # partition are sorted to a run
+        runs = []
+        for part in self._partitions:
+            part.seek(0)
+            # dimension -> (seq, row)
+            merged = {}
+            for d, seq, states in _load_all(part):
+                row = self._new_row(states)
+                if d in merged:
+                    for fn, other in zip(merged[d][1].values(), row.values()):
+                        fn.merge(other)
+                else:
+                    merged[d] = (seq, row)
+            part.close()
+
+            rows = [(seq, d, row) for d, (seq, row) in merged.items()
+                    if self._select_row(d, row)]
+            rows.sort(key=_row_key(order_cmp))
+
+            run = tempfile.TemporaryFile(prefix='fql-group-')
+            for seq, d, row in rows:
+                pickle.dump((d, seq, self._row_states(row)), run, 2)
+            runs.append(run)
+
+        self._partitions = runs
+        return _MergedGroups(self, order_cmp, start, end)
+
+    def clone(self):
+        '''
+            an empty GroupBy of the same dimensions and aggregations
+        '''
+        return GroupBy(**self._kwargs)
+
+    def partials(self):
+        '''
+            list of (dimension, states of the aggregations) of the groups,
+            in the order they're first seen. They can be saved and merged by
+            'merge_partials' of a GroupBy of the same statement.
+        '''
+        return [(d, self._row_states(row)) for d, row in
+                self._dimension_accufuncs.iteritems()]
+
+    def merge_partials(self, partials):
+        '''
+            accumulate the groups of partials, whose files are after the
+            files of self
+        '''
+        for d, states in partials:
+            row = self._new_row(states)
+            if d in self._dimension_accufuncs:
+                for fn, other in zip(self._accu_fns(
+                        self._dimension_accufuncs[d]), row.values()):
+                    fn.merge(other)
+                continue
+
+            self._dimension_accufuncs[d] = row
+            if self._mem_budget:
+                self._add_mem(d)
+                if self._mem > self._mem_budget:
+                    self._spill()
+
+    def dimension(self, finfo):
+        '''
+            dimension of the group which finfo is in
+        '''
+        return self._dim_fn(finfo)
+
+    def retract(self, finfo):
+        '''
+            remove finfo accumulated before from its group, return False if
+            an aggregation can't remove it, such as max of the removed file.
+            The group has to be reset by 'reset_group' and accumulated
+            again. Groups spilled to disk can't be retracted.
+        '''
+        row = self._dimension_accufuncs[self._dim_fn(finfo)]
+        retracted = True
+        for fn in self._accu_fns(row):
+            retracted = fn.retract(finfo) and retracted
+        return retracted
+
+    def reset_group(self, d):
+        '''
+            clear the aggregations of the group, which keeps its order
+        '''
+        self._dimension_accufuncs[d] = self._new_row()
+
+    def remove_group(self, d):
+        del self._dimension_accufuncs[d]
+
+    def spilled(self):
+        return self._partitions is not None
+
+    def close(self):
+        for part in self._partitions or []:
+            part.close()
+
+    def _select_row(self, d, acc_vals_row):
+        # add aliases
+        if self._aliases:
+            for k, acc_fn in acc_vals_row.items():
+                if k in self._aliases['to_alias']:
+                    acc_vals_row[self._aliases['to_alias'][k]] = acc_fn
+
+        # the dimensions are added to the row when it was selected before
+        if not self._accu_selector or \
+                self._accu_selector(dict([(k, fn.val()) for k, fn in
+                                          acc_vals_row.items()
+                                          if k not in self._dimensions])):
+            if len(self._dim_names) == 1:
+                acc_vals_row[self._dim_name] = d
+            else:
+                acc_vals_row.update(zip(self._dim_names, d))
+            return True
+
+        return False
+
+    def empty_row(self):
+        '''
+            aggregations of a group without any file, such as the result of
+            select aggregation when no file is matched
+        '''
+        return self._new_row()
+
+    def _new_row(self, states=None):
+        row = OrderedDict()
+        for f in self._accu_func_creators:
+            fn = f()
+            row[fn.key()] = fn
+
+        if states:
+            for fn, state in zip(row.values(), states):
+                fn.load(state)
+
+        return row
+
+    def _row_states(self, row):
+        return [fn.state() for fn in self._accu_fns(row)]
+
+    def _accu_fns(self, row):
+        # aliases and dimension are added to the selected rows, only the
+        # functions are returned, in the order of '_new_row'
+        if self._accu_keys is None:
+            self._accu_keys = self._new_row().keys()
+        return [row[k] for k in self._accu_keys]
+
+    def _add_mem(self, dim_val):
+        self._seqs[dim_val] = self._seq
+        self._seq += 1
+
+        if self._group_size is None:
+            row = self._dimension_accufuncs[dim_val]
+            self._group_size = sys.getsizeof(row) + 2 * sys.getsizeof(0) + \
+                sum(sys.getsizeof(fn) + sys.getsizeof(fn.__dict__) for fn in
+                    row.values())
+        self._mem += self._group_size + sys.getsizeof(dim_val)
+
+    def _spill(self):
+        if self._partitions is None:
+            self._partitions = [tempfile.TemporaryFile(prefix='fql-group-')
+                                for i in xrange(_PARTITIONS)]
+
+        for d, row in self._dimension_accufuncs.iteritems():
+            part = self._partitions[hash(d) % _PARTITIONS]
+            pickle.dump((d, self._seqs[d], self._row_states(row)), part, 2)
+
+        self._dimension_accufuncs = OrderedDict()
+        self._seqs = {}
+        self._mem = 0
+
     def get_accu_func(self):
         return [f() for f in self._accu_func_creators]
 
     def get_dim_name(self):
         return self._dim_name
 
+    def get_dim_names(self):
+        return self._dim_names
+
+    def get_dimensions(self):
+        return self._dimensions
+
     def get_aliases(self):
         return self._aliases
+
+
+def _load_all(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def _row_key(order_cmp):
+    '''
+        key of (seq, dimension, row), ties of order_cmp are broken by seq
+    '''
+    if not order_cmp:
+        return lambda r: r[0]
+
+    key = cmp_to_key(order_cmp)
+    return lambda r: (key(r[2]), r[0])
+
+
+class _MergedGroups(object):
+    '''
+        k-way merge of the sorted runs of GroupBy
+    '''
+    def __init__(self, groupby, order_cmp, start, end):
+        self._groupby = groupby
+        self._key = _row_key(order_cmp)
+        self._start = start
+        self._end = end
+
+    def __iter__(self):
+        merged = heapq.merge(*[self._load_run(run) for run in
+                               self._groupby._partitions])
+        return islice((row for _, row in merged), self._start, self._end)
+
+    def _load_run(self, run):
+        run.seek(0)
+        for d, seq, states in _load_all(run):
+            row = self._groupby._new_row(states)
+            self._groupby._select_row(d, row)
+            r = (seq, d, row)
+            yield self._key(r), r[2]
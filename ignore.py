@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    ignore
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-21 10:12:35
+
+import os
+from fnmatch import fnmatchcase
+
+
+# ignore files read by '--respect-ignore'
+IGNORE_FILES = ('.gitignore', '.fqlignore')
+
+
+class IgnoreRules(object):
+    '''
+        Patterns of the ignore files in a directory, in the syntax of
+        .gitignore:
+            - blank lines and lines starting with '#' are skipped
+            - '!' negates the pattern
+            - a trailing '/' matches directories only
+            - a pattern with '/' is matched with the path relative to the
+              directory of the ignore file, the others with the name
+        The last matched pattern wins, and the rules of a directory override
+        the rules of its parents.
+    '''
+    def __init__(self, base, patterns, parent=None):
+        self._base = base
+        self._parent = parent
+        # list of (pattern, negated, directory only, matched with path)
+        self._rules = []
+        for line in patterns:
+            line = line.rstrip('\r\n').rstrip(' ')
+            if not line or line.startswith('#'):
+                continue
+
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+
+            with_path = '/' in line
+            self._rules.append((line.lstrip('/'), negated, dir_only,
+                                with_path))
+
+    @staticmethod
+    def load(d, parent=None, names=IGNORE_FILES):
+        '''
+            return the rules of the ignore files in directory d, or parent if
+            there isn't any ignore file
+        '''
+        patterns = []
+        for name in names:
+            try:
+                with open(os.path.join(d, name)) as f:
+                    patterns.extend(f.readlines())
+            except IOError:
+                continue
+
+        if not patterns:
+            return parent
+        return IgnoreRules(d, patterns, parent)
+
+    def ignored(self, f, is_dir):
+        '''
+            check if the entry f is ignored
+        '''
+        name = os.path.basename(f)
+        rel = f[len(self._base):].lstrip('/')
+        for pattern, negated, dir_only, with_path in reversed(self._rules):
+            if dir_only and not is_dir:
+                continue
+            target = name
+            if with_path:
+                # '**/a' matches 'a' in all the directories
+                target = '/' + rel if pattern.startswith('**/') else rel
+            if fnmatchcase(target, pattern):
+                return not negated
+
+        return self._parent.ignored(f, is_dir) if self._parent else False
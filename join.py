@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    join
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-22 15:20:07
+
+import time
+import threading
+from Queue import Queue, Empty
+from itertools import islice
+from walker import LocalFs, Walker, travel_context, BudgetExceeded
+from treediff import SortedFs, path_key
+from ignore import IGNORE_FILES
+
+
+# fields selected by 'select *' of join
+ALL_JOIN_FIELDS = ['relpath', 'a.size', 'a.mtime', 'b.size', 'b.mtime']
+
+# entries put to the queue at a time by a side
+_BATCH = 256
+# batches buffered for a side, the travel waits when they're full
+_MAX_BATCHES = 64
+
+
+class JoinRow(object):
+    '''
+        entries of the roots with the same key, the entry missing in a root
+        is None. The conditions on unqualified fields, such as 'size > 10',
+        see the entry of the left root, or the right root if it's missing.
+    '''
+    __slots__ = ('relpath', 'entries')
+
+    def __init__(self, relpath, a, b):
+        self.relpath = relpath
+        self.entries = (a, b)
+
+    def value(self, side, field):
+        finfo = self.entries[side]
+        if finfo is None:
+            return None
+        elif field == 'name':
+            return finfo.name
+        elif field == 'path':
+            return finfo.path
+        elif field == 'depth':
+            return finfo.depth
+        return getattr(finfo.stat, 'st_' + field)
+
+    def _present(self):
+        return self.entries[0] or self.entries[1]
+
+    name = property(lambda self: self._present().name)
+    path = property(lambda self: self._present().path)
+    stat = property(lambda self: self._present().stat)
+    depth = property(lambda self: self._present().depth)
+
+
+class _Stopped(Exception):
+    pass
+
+
+class JoinSide(threading.Thread):
+    '''
+        travel a root in a thread, the entries are put to queue in batches
+        of (side, list of (key, FileInfo)), and (side, None) at the end
+    '''
+    def __init__(self, side, root, key, queue, conf, fs=None):
+        threading.Thread.__init__(self, name='fql-join-%d' % side)
+        self.daemon = True
+        self.side = side
+        self.root = root
+        # exception which stopped the travel, None if it's completed
+        self.error = None
+        self._key = key
+        self.queue = queue
+        self._conf = conf
+        self._fs = fs or LocalFs()
+        self._batch = []
+        self._stopped = False
+
+    def run(self):
+        conf = self._conf
+        try:
+            ctx = travel_context(self.root, conf.get('one_file_system'),
+                                 fs=self._fs)
+            if conf.get('deadline'):
+                ctx['deadline'] = conf['deadline']
+            ctx['max_files'] = conf.get('max_files') or 0
+            ctx['exclude'], ctx['prune'] = conf['exclude'], conf['prune']
+            if conf.get('respect_ignore'):
+                ctx['ignore_files'] = IGNORE_FILES
+            Walker(lambda finfo, alias: True, None, None,
+                   conf.get('depth') or None, ctx=ctx, fs=self._fs,
+                   emit=self._emit).walk(self.root)
+            self._flush()
+        except _Stopped:
+            return
+        except Exception as e:
+            self.error = e
+        self.queue.put((self.side, None))
+
+    def stop(self):
+        '''
+            stop the travel, called by the consumer of queue
+        '''
+        self._stopped = True
+        while self.is_alive():
+            # unblock the travel waiting for the full queue
+            try:
+                while True:
+                    self.queue.get_nowait()
+            except Empty:
+                pass
+            self.join(0.01)
+
+    def _emit(self, finfo, matched):
+        if self._stopped:
+            raise _Stopped()
+
+        if self._key == 'name':
+            key = finfo.name
+        else:
+            rel = finfo.path[len(self.root):].strip('/')
+            key = rel + '/' + finfo.name if rel else finfo.name
+        self._batch.append((key, finfo))
+        if len(self._batch) >= _BATCH:
+            self._flush()
+
+    def _flush(self):
+        if self._batch:
+            self.queue.put((self.side, self._batch))
+            self._batch = []
+
+
+class JoinQuery(object):
+    '''
+        Join the entries of two roots by 'relpath' or 'name'. Both roots
+        are travelled concurrently and the rows are returned while they're
+        travelled:
+            - hash join: the entries not matched yet are kept in a table of
+              each side, an entry is matched with the table of the other
+              side. When a side is finished, the table of the other side
+              is flushed and its following entries aren't kept, so at most
+              the entries travelled before the smaller side is finished
+              are kept.
+            - merge join, with 'join_method' 'merge' on 'relpath': the
+              roots are travelled in the order of sorted names, and the
+              entries are merged in the order of 'path_key' without a
+              table. The rows are sorted by relpath.
+    '''
+    def __init__(self, left, join, fields, where, limit, exclude, prune,
+                 conf):
+        self.fields = ALL_JOIN_FIELDS if '*' in fields else list(fields)
+        # why the result is partial, None if the travel is completed
+        self.partial = None
+        self._how, self._key = join['how'], join['key']
+        self._where = where
+        self._limit = limit
+        self._merge = conf.get('join_method') == 'merge'
+        if self._merge and self._key != 'relpath':
+            raise Exception('merge join is only on \'relpath\'')
+
+        side_conf = {
+            'depth': conf.get('depth'),
+            'one_file_system': conf.get('one_file_system'),
+            'respect_ignore': conf.get('respect_ignore'),
+            'max_files': conf.get('max_files'),
+            'deadline': time.time() + conf['timeout'] if conf.get('timeout')
+            else None,
+            'exclude': exclude,
+            'prune': prune,
+        }
+        roots = [left.rstrip('/') or '/', join['root'].rstrip('/') or '/']
+        fs = SortedFs() if self._merge else None
+        shared = None if self._merge else Queue(_MAX_BATCHES * 2)
+        self._sides = [JoinSide(i, root, self._key,
+                                shared or Queue(_MAX_BATCHES), side_conf, fs)
+                       for i, root in enumerate(roots)]
+        self._queue = shared
+        for side in self._sides:
+            side.start()
+
+    def rows(self):
+        '''
+            yield the rows as tuples of raw values of the fields, see
+            'executor.typed_rows'
+        '''
+        getters = [self._getter(f) for f in self.fields]
+        joined = self._merged() if self._merge else self._hashed()
+        rows = (tuple(g(r) for g in getters) for r in joined
+                if self._where(r, None))
+
+        if self._limit:
+            s, c = (0, self._limit[0]) if len(self._limit) == 1 \
+                else self._limit
+            rows = islice(rows, s, s + c)
+
+        try:
+            for r in rows:
+                yield r
+        finally:
+            self.close()
+
+    def close(self):
+        for side in self._sides:
+            side.stop()
+
+    def _hashed(self):
+        unique = self._key == 'relpath'
+        # side -> key -> list of [FileInfo, matched]
+        tables = [{}, {}]
+        done = [False, False]
+        while not all(done):
+            side, batch = self._queue.get()
+            other = 1 - side
+            if batch is None:
+                done[side] = True
+                self._check_side(side)
+                # the entries of other can't be matched any more
+                for r in self._flush_table(tables[other], other):
+                    yield r
+                tables[other] = None
+                continue
+
+            table, other_table = tables[side], tables[other]
+            for key, finfo in batch:
+                matches = other_table.get(key) if other_table else None
+                if matches:
+                    for m in matches:
+                        m[1] = True
+                        yield self._row(key, side, finfo, m[0])
+                    if unique:
+                        del other_table[key]
+                        continue
+                elif done[other]:
+                    if self._outer(side):
+                        yield self._row(key, side, finfo, None)
+                    continue
+
+                if table is not None:
+                    table.setdefault(key, []).append([finfo, bool(matches)])
+
+        for side in (0, 1):
+            for r in self._flush_table(tables[side], side):
+                yield r
+
+    def _flush_table(self, table, side):
+        if not table or not self._outer(side):
+            return
+        for key, entries in table.iteritems():
+            for finfo, matched in entries:
+                if not matched:
+                    yield self._row(key, side, finfo, None)
+
+    def _merged(self):
+        its = [self._side_entries(side) for side in self._sides]
+        a, b = next(its[0], None), next(its[1], None)
+        while a is not None or b is not None:
+            c = -1 if b is None else 1 if a is None else \
+                cmp(path_key(a[0]), path_key(b[0]))
+            if c < 0:
+                if self._outer(0):
+                    yield JoinRow(a[0], a[1], None)
+                a = next(its[0], None)
+            elif c > 0:
+                if self._outer(1):
+                    yield JoinRow(b[0], None, b[1])
+                b = next(its[1], None)
+            else:
+                yield JoinRow(a[0], a[1], b[1])
+                a, b = next(its[0], None), next(its[1], None)
+
+    def _side_entries(self, side):
+        queue = side.queue
+        while True:
+            _, batch = queue.get()
+            if batch is None:
+                self._check_side(side.side)
+                return
+            for entry in batch:
+                yield entry
+
+    def _outer(self, side):
+        '''
+            if the entries only in side are returned
+        '''
+        return self._how == 'full' or self._how == 'left' and side == 0
+
+    def _row(self, key, side, finfo, other):
+        a, b = (finfo, other) if side == 0 else (other, finfo)
+        return JoinRow(key, a, b)
+
+    def _check_side(self, idx):
+        side = self._sides[idx]
+        if side.error is None:
+            return
+        if not isinstance(side.error, BudgetExceeded):
+            raise side.error
+
+        # the unmatched entries of the other side may be matched in the
+        # part not travelled
+        self.partial = '%s, travelling %s' % (side.error, side.root)
+
+    @staticmethod
+    def _getter(field):
+        if field == 'relpath':
+            return lambda row: row.relpath
+
+        side, dot, f = field.partition('.')
+        side = 0 if side == 'a' else 1
+        if not f.endswith('time'):
+            return lambda row: row.value(side, f)
+
+        def time_getter(row):
+            val = row.value(side, f)
+            return None if val is None else float(val)
+        return time_getter
@@ -23,6 +23,21 @@ reserved = {
     'or': 'OR',
     'not': 'NOT',
     'like': 'LIKE',
+    'contains': 'CONTAINS',
+    'exclude': 'EXCLUDE',
+    'prune': 'PRUNE',
+    'in': 'IN',
+    'file': 'FILE',
+    'join': 'JOIN',
+    'left': 'LEFT',
+    'full': 'FULL',
+    'on': 'ON',
+    'create': 'CREATE',
+    'view': 'VIEW',
+    'as': 'AS',
+    'refresh': 'REFRESH',
+    'watch': 'WATCH',
+    'every': 'EVERY',
     # accumulative functions
     'max': 'MAX',
     'min': 'MIN',
@@ -36,13 +51,18 @@ reserved = {
     'ctime': 'CTIME',
     'mtime': 'MTIME',
     'atime': 'ATIME',
+    'lines': 'LINES',
     'ftype': 'FTYPE',
+    'depth': 'DEPTH',
     # group by func
     'minute': 'MINUTE',
     'hour': 'HOUR',
     'day': 'DAY',
     'month': 'MONTH',
-    'year': 'YEAR'
+    'year': 'YEAR',
+    # group by size
+    'bucket': 'BUCKET',
+    'log2': 'LOG2'
 }
 
 tokens = [
@@ -54,6 +74,7 @@ tokens = [
     'DATE',
     'NUMBER',
     'FNAME',
+    'PARAM',    # '?' of prepared statements
     ] + reserved.values()
 
 literals = '=()*<>\'",'
@@ -76,6 +97,21 @@ t_GE = r'>='
 t_NE = r'!='
 t_QUOTE = r'(\')|"'
 t_LIKE = r'(like)|(LIKE)'
+t_CONTAINS = r'(contains)|(CONTAINS)'
+t_EXCLUDE = r'(exclude)|(EXCLUDE)'
+t_PRUNE = r'(prune)|(PRUNE)'
+t_IN = r'(in)|(IN)'
+t_FILE = r'(file)|(FILE)'
+t_JOIN = r'(join)|(JOIN)'
+t_LEFT = r'(left)|(LEFT)'
+t_FULL = r'(full)|(FULL)'
+t_ON = r'(on)|(ON)'
+t_CREATE = r'(create)|(CREATE)'
+t_VIEW = r'(view)|(VIEW)'
+t_AS = r'(as)|(AS)'
+t_REFRESH = r'(refresh)|(REFRESH)'
+t_WATCH = r'(watch)|(WATCH)'
+t_EVERY = r'(every)|(EVERY)'
 t_MAX = r'(max)|(MAX)'
 t_MIN = r'(min)|(MIN)'
 t_AVG = r'(avg)|(AVG)'
@@ -87,14 +123,53 @@ t_SIZE = r'(\size)|(\SIZE)'
 t_CTIME = r'(\ctime)|(\CTIME)'
 t_MTIME = r'(\mtime)|(\MTIME)'
 t_ATIME = r'(\atime)|(\ATIME)'
+t_LINES = r'(lines)|(LINES)'
 t_FTYPE = r'(ftype)|(FTYPE)'
+t_DEPTH = r'(depth)|(DEPTH)'
 t_MINUTE = r'(minute)|(MINUTE)'
 t_HOUR = r'(hour)|(HOUR)'
 t_DAY = r'(day)|(DAY)'
 t_MONTH = r'(month)|(MONTH)'
 t_YEAR = r'(year)|(YEAR)'
+t_BUCKET = r'(bucket)|(BUCKET)'
+t_LOG2 = r'(log2)|(LOG2)'
 t_ignore = ' \t\n'
 
+# suffixes of numbers, such as '1M' for 1048576 bytes
+SIZE_UNITS = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+class Param(object):
+    '''
+        placeholder '?' of a prepared statement. The predicates built on it
+        read 'value', which is bound before each execution.
+    '''
+    def __init__(self, idx):
+        self.idx = idx
+        self.value = None
+        # converts the bound value to the type compared by the predicate,
+        # set by the grammar
+        self.convert = None
+
+    def bind(self, val):
+        self.value = self.convert(val) if self.convert else val
+
+    def __repr__(self):
+        return '?%d' % self.idx
+
+
+def t_PARAM(t):
+    r'\?(?=[\s\),]|$)'
+    # 'params' of the lexer is set by 'prepare', which collects the
+    # placeholders in the order of the statement
+    params = getattr(t.lexer, 'params', None)
+    if params is None:
+        raise Exception('placeholder \'?\' is only allowed in prepared '
+                        'statements')
+    t.value = Param(len(params))
+    params.append(t.value)
+    return t
+
 
 def t_TIME(t):
     r'\d{2}:\d{2}:\d{2}'
@@ -107,25 +182,42 @@ def t_DATE(t):
 
 
 def t_NUMBER(t):
-    r'0|(\d+)\.?(\d+)?'
-    t.value = int(t.value)
+    r'(0|(\d+)\.?(\d+)?)[KMGT]?'
+    unit = SIZE_UNITS.get(t.value[-1])
+    t.value = int(float(t.value[:-1]) * unit) if unit else int(t.value)
     return t
 
 
+# the word after them is a path or the name of a view, never a keyword,
+# except 'from view v'
+_NAME_BEFORE = ('from', 'join', 'view')
+
+
 def t_FNAME(t):
     r'[^ \t\n=\(\)\*\<\>\'",!]+'
-    if t.value in reserved:
-        t.type = reserved[t.value]
-        return t
     lower_case = t.value.lower()
-
-    if lower_case in reserved:
+    if lower_case in reserved and not _literal_word(t, lower_case):
         t.type = reserved[lower_case]
-        return t
 
     return t
 
 
+def _literal_word(t, lower_case):
+    '''
+        check if the word is quoted, or is a path or a view name, which is
+        not a keyword
+    '''
+    before = t.lexer.lexdata[:t.lexpos]
+    # quotes aren't escaped in statements
+    if (before.count('"') + before.count('\'')) % 2:
+        return True
+
+    words = before.split()
+    prev = words[-1].lower() if words else None
+    return prev in _NAME_BEFORE and not (prev == 'from' and
+                                         lower_case == 'view')
+
+
 def t_newline(t):
     r'\n+'
     t.lexer.lineno += len(t.value)
@@ -6,6 +6,7 @@
 # @author:  chosen0ne(louzhenlin86@126.com)
 # @date:    2015/01/21 14:43:05
 import itertools
+import content
 from datetime import datetime
 from accu_func import AccuFuncCls
 
@@ -33,10 +34,10 @@ class Printer(object):
             print self._sep_line
 
     def print_table(self):
+        # rows are iterated twice, the first time to get the width of columns
         fields = self.fields()
-        rows = self.rows()
 
-        cols_width = self._calc_cols_width(fields, rows)
+        cols_width = self._calc_cols_width(fields, self.rows())
         self._sep_line = self._get_sep_line(cols_width)
 
         # title
@@ -48,16 +49,12 @@ class Printer(object):
 
             print self._col_sep
 
-        if rows:
-            self.print_sep_line()
-            for r in rows:
-                for v, w in zip(r, cols_width):
-                    self._print_val(v, w)
-
-                print self._col_sep
-                self.print_sep_line()
+        self.print_sep_line()
+        for r in self.rows():
+            for v, w in zip(r, cols_width):
+                self._print_val(v, w)
 
-        else:
+            print self._col_sep
             self.print_sep_line()
 
     def _get_sep_line(self, fields_len):
@@ -70,18 +67,18 @@ class Printer(object):
         return sep_line
 
     def _calc_cols_width(self, fields, rows):
-        if not fields and not rows:
-            raise Exception('No fields and rows')
-
-        if fields:
-            cols_width = [len(f) for f in fields]
-        else:
-            cols_width = [v for v in itertools.repeat(0, len(rows[0]))]
+        cols_width = [len(f) for f in fields] if fields else None
 
         for r in rows:
+            if cols_width is None:
+                cols_width = [v for v in itertools.repeat(0, len(r))]
+
             for idx in xrange(len(r)):
                 cols_width[idx] = max(len(r[idx]), cols_width[idx])
 
+        if cols_width is None:
+            raise Exception('No fields and rows')
+
         return cols_width
 
     def _fetch_size_val(self, size_val):
@@ -114,22 +111,23 @@ class FieldPrinter(Printer):
             self._select_fields = map(lambda f: f.lower(), show_fields)
 
         self._aliases = aliases
-        self._rows = []
-        for f in files:
-            self._rows.append([self._fetch_val(field, f) for field in
-                              self._select_fields])
+        # files can be iterated several times, the rows are formatted when
+        # they are iterated, so spilled files are never loaded all
+        self._files = files
 
         if not show_border:
             self.no_border()
 
     def _fetch_val(self, field, finfo):
         if field == 'name':
-            return finfo['name']
+            return finfo.name
         elif field == 'path':
-            return finfo['path']
+            return finfo.path
+        elif field == 'lines':
+            return str(content.lines(finfo))
         else:
             f = 'st_' + field
-            statinfo = finfo['stat']
+            statinfo = finfo.stat
             val = getattr(statinfo, f)
             if field[-4:] == 'time':
                 d = datetime.fromtimestamp(val)
@@ -144,7 +142,8 @@ class FieldPrinter(Printer):
         return fields
 
     def rows(self):
-        return self._rows
+        for f in self._files:
+            yield [self._fetch_val(field, f) for field in self._select_fields]
 
 
 class AggregatePrinter(Printer):
@@ -170,14 +169,30 @@ class AggregatePrinter(Printer):
 
 
 class GroupPrinter(Printer):
-    def __init__(self, dim_rows, dim_name, accu_fns, aliases, show_border):
-        self._fields = [dim_name]
+    def __init__(self, dim_rows, dimensions, accu_fns, aliases, show_border):
+        # each dimension is a column
+        self._fields = dimensions.keys()
+        self._fetch_dims = dict((k, self._dim_fetcher(fn))
+                                for k, fn in dimensions.items())
         self._fields.extend([f().key() for f in accu_fns.values()])
         self._aliases = aliases
 
-        self._rows = []
-        # dim_rows is a list of dict{str -> str / AccuFuncCls}
-        for r_dict in dim_rows:
+        # dim_rows is an iterable of dict{str -> str / AccuFuncCls}, which
+        # can be iterated several times, the rows are formatted when they
+        # are iterated
+        self._dim_rows = dim_rows
+
+        if not show_border:
+            self.no_border()
+
+    def fields(self):
+        a = self._aliases
+        fields = map(lambda f: a['to_alias'][f] if a and f in a['to_alias']
+                     else f, self._fields)
+        return fields
+
+    def rows(self):
+        for r_dict in self._dim_rows:
             r = []
             for f in self._fields:
                 val = r_dict[f]
@@ -188,19 +203,107 @@ class GroupPrinter(Printer):
                         str(fn.val())
                     if fn.fname():
                         val = val + ': ' + fn.fname()
+                elif f in self._fetch_dims:
+                    val = self._fetch_dims[f](val)
 
                 r.append(val)
 
-            self._rows.append(r)
+            yield r
+
+    def _dim_fetcher(self, dim_fn):
+        size_range = getattr(dim_fn, 'size_range', None)
+        if not size_range:
+            return str
+
+        # int dimension of size, such as 'log2(size)', shown as the range
+        return lambda val: '[%s, %s)' % tuple(
+            self._fetch_size_val(v) for v in size_range(val))
+
+
+class RowsPrinter(Printer):
+    '''
+        print the fields and rows fetched from other printers, such as the
+        results returned by fql server
+    '''
+    def __init__(self, fields, rows, show_border):
+        self._fields = fields
+        self._rows = rows
 
         if not show_border:
             self.no_border()
 
     def fields(self):
-        a = self._aliases
-        fields = map(lambda f: a['to_alias'][f] if a and f in a['to_alias']
-                     else f, self._fields)
-        return fields
+        return self._fields
 
     def rows(self):
         return self._rows
+
+
+class JoinPrinter(Printer):
+    '''
+        print the rows of join, see 'join.JoinQuery'. The fields of the
+        entry missing in a root are empty.
+    '''
+    def __init__(self, fields, rows, show_border):
+        self._fields = fields
+        # rows are iterated twice, they are kept in a list
+        self._rows = rows
+
+        if not show_border:
+            self.no_border()
+
+    def fields(self):
+        return self._fields
+
+    def rows(self):
+        fetches = [self._fetch(f) for f in self._fields]
+        for r in self._rows:
+            yield [fetch(v) if v is not None else ''
+                   for fetch, v in zip(fetches, r)]
+
+    def _fetch(self, field):
+        if field.endswith('size'):
+            return self._fetch_size_val
+        elif field.endswith('time'):
+            return lambda v: datetime.fromtimestamp(v).strftime(
+                '%Y-%m-%d %H:%M:%S')
+        return str
+
+
+class DiffPrinter(Printer):
+    '''
+        print the changes of snapshot diffs, see 'treediff.SnapshotDiff'
+    '''
+    def __init__(self, changes, show_border):
+        # changes can be iterated several times, each time they are merged
+        # from the snapshot files again
+        self._changes = changes
+
+        if not show_border:
+            self.no_border()
+
+    def fields(self):
+        return ['change', 'path', 'size', 'size delta', 'mtime',
+                'mtime delta']
+
+    def rows(self):
+        for change, path, size, size_delta, mtime, mtime_delta in \
+                self._changes:
+            d = datetime.fromtimestamp(mtime)
+            # added and removed entries have no mtime delta
+            if mtime_delta is not None:
+                mtime_delta = round(mtime_delta, 3)
+            yield [change, path, self._fetch_size_val(size),
+                   self._fetch_delta(size_delta, self._fetch_size_val),
+                   d.strftime('%Y-%m-%d %H:%M:%S'),
+                   self._fetch_delta(mtime_delta, self._fetch_seconds)]
+
+    def _fetch_delta(self, delta, fetch):
+        if not delta:
+            return ''
+        return ('+' if delta > 0 else '-') + fetch(abs(delta))
+
+    @staticmethod
+    def _fetch_seconds(v):
+        # sub-second changes are shown in milliseconds
+        return '%ds' % round(v) if v >= 1 else '%.3fs' % v
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    server
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-19 18:05:44
+
+import os
+import json
+import time
+import stat
+import errno
+import socket
+import threading
+import SocketServer
+from collections import OrderedDict
+from executor import plan_query, walk_queries, query_printer, \
+    close_query
+from grammar_parser import parser
+from snapshot import SnapshotFs
+
+
+'''
+protocol:
+    A request is a JSON object in one line, the responses of it are JSON
+    objects in lines. A connection can send several requests one by one.
+
+    query request:
+        {"stmt": "select ...", "timeout": 5, "depth": 3}
+            - timeout, depth: optional, override the conf of server
+        responses:
+            {"fields": ["name", "size"]}
+            {"row": ["fql.py", "1.85K"]}
+            ...
+            {"end": true, "rows": 2, "cost": 0.003, "partial": null}
+                - partial: why the result is partial, such as a budget is
+                  exceeded. null if the result is complete.
+
+    snapshot request, the following queries within the snapshot are executed
+    in memory, see 'SnapshotFs':
+        {"snapshot": "/data", "depth": 3}
+        responses:
+            {"snapshot": {"root": "/data", "dirs": 12, ...}}
+
+    failure of any request:
+        {"error": "message"}
+'''
+
+
+# max statements whose parse results are kept
+_MAX_PLANS = 256
+
+# request conf can override these conf of server
+_REQUEST_CONF = ('timeout', 'depth', 'max_bytes_read', 'max_files')
+
+
+class ServerBusy(Exception):
+    pass
+
+
+class FqlServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''
+        Execute queries from clients connected to a Unix domain socket. At
+        most 'workers' queries are executed concurrently, and requests are
+        rejected when 'max_pending' requests are waiting or running.
+        Parse results and snapshots are kept between requests.
+    '''
+    daemon_threads = True
+
+    def __init__(self, sock_path, conf, workers=4, max_pending=64):
+        _remove_stale_socket(sock_path)
+
+        SocketServer.UnixStreamServer.__init__(self, sock_path,
+                                               FqlRequestHandler)
+        self._conf = conf
+        self._workers = threading.BoundedSemaphore(workers)
+        self._max_pending = max_pending
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+        # ply parser isn't thread safe, statements are parsed and planned
+        # under the lock
+        self._plan_lock = threading.Lock()
+        # stmt -> parse result
+        self._plans = OrderedDict()
+        # root -> SnapshotFs
+        self._snapshots = {}
+
+    def execute(self, req, send):
+        '''
+            execute the query request, the results are passed to 'send'
+            one by one
+        '''
+        self._admit()
+        try:
+            with self._workers:
+                start = time.time()
+                conf = self._request_conf(req)
+                with self._plan_lock:
+                    kwargs = dict(self._parse(req['stmt']))
+                    kwargs.update(conf)
+                    query = plan_query(**kwargs)
+
+                snapshot = self._snapshots.get(query['from'])
+                if snapshot:
+                    conf['snapshot'] = snapshot
+                try:
+                    walk_queries(query['from'], [query], conf)
+                    self._send_rows(query, start, send)
+                finally:
+                    close_query(query)
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+
+    def _send_rows(self, query, start, send):
+        printer = query_printer(query)
+        send({'fields': printer.fields()})
+        count = 0
+        for r in printer.rows():
+            send({'row': list(r)})
+            count += 1
+        send({'end': True, 'rows': count, 'cost': time.time() - start,
+              'partial': query['partial']})
+
+    def snapshot(self, req):
+        '''
+            capture the snapshot of the request, admitted as a query
+        '''
+        self._admit()
+        try:
+            with self._workers:
+                conf = self._request_conf(req)
+                root = req['snapshot']
+                snapshot = SnapshotFs(root, conf['depth'],
+                                      conf.get('auto_refresh'))
+                self._snapshots[root] = snapshot
+
+                return snapshot.info()
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
+
+    def _admit(self):
+        with self._pending_lock:
+            if self._pending >= self._max_pending:
+                raise ServerBusy('server busy, pending requests: %d'
+                                 % self._pending)
+            self._pending += 1
+
+    def _request_conf(self, req):
+        conf = dict(self._conf)
+        for k in _REQUEST_CONF:
+            if k in req:
+                conf[k] = req[k]
+
+        # results are returned to clients instead of printed
+        conf['debug'] = False
+        conf['progress'] = False
+        return conf
+
+    def _parse(self, stmt):
+        if stmt in self._plans:
+            return self._plans[stmt]
+
+        stmts = parser.parse(stmt)
+        if stmts is None:
+            raise Exception('failed to parse, statement: %s' % stmt)
+
+        if len(self._plans) >= _MAX_PLANS:
+            self._plans.popitem(last=False)
+        self._plans[stmt] = stmts
+
+        return stmts
+
+
+class FqlRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip():
+                continue
+
+            try:
+                req = _to_str(json.loads(line))
+                if 'snapshot' in req:
+                    self._send({'snapshot': self.server.snapshot(req)})
+                else:
+                    self.server.execute(req, self._send)
+            except socket.error:
+                return
+            except Exception as e:
+                self._send({'error': str(e)})
+
+    def _send(self, resp):
+        self.wfile.write(json.dumps(resp) + '\n')
+        self.wfile.flush()
+
+
+def _remove_stale_socket(sock_path):
+    '''
+        remove the socket left by a server which isn't running, fail if
+        sock_path isn't a socket or a server is listening on it
+    '''
+    try:
+        st = os.lstat(sock_path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+
+    if not stat.S_ISSOCK(st.st_mode):
+        raise Exception('not a socket, refuse to remove: %s' % sock_path)
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(sock_path)
+    except socket.error:
+        os.unlink(sock_path)
+        return
+    finally:
+        s.close()
+
+    raise Exception('a server is running on %s' % sock_path)
+
+
+def _to_str(obj):
+    '''
+        json decodes strings as unicode, but the parser and the file names
+        work on str
+    '''
+    if isinstance(obj, unicode):
+        return obj.encode('utf8')
+    elif isinstance(obj, dict):
+        return dict((_to_str(k), _to_str(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [_to_str(v) for v in obj]
+    return obj
+
+
+class FqlClient(object):
+    '''
+        client of FqlServer
+            c = FqlClient('/run/fql.sock')
+            fields, rows = c.query('select name from .')
+    '''
+    def __init__(self, sock_path, timeout=None):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(sock_path)
+        self._rfile = self._sock.makefile('rb')
+        # why the result of the last query is partial, None if complete
+        self.partial = None
+
+    def close(self):
+        self._rfile.close()
+        self._sock.close()
+
+    def stream(self, stmt, **conf):
+        '''
+            yield the fields first, then the rows one by one
+        '''
+        req = dict(conf)
+        req['stmt'] = stmt
+        self._request(req)
+
+        while True:
+            resp = self._response()
+            if 'fields' in resp:
+                yield resp['fields']
+            elif 'row' in resp:
+                yield resp['row']
+            elif 'end' in resp:
+                self.partial = resp.get('partial')
+                return
+
+    def query(self, stmt, **conf):
+        '''
+            return fields and list of rows
+        '''
+        it = self.stream(stmt, **conf)
+        fields = next(it)
+        return fields, list(it)
+
+    def snapshot(self, root, **conf):
+        req = dict(conf)
+        req['snapshot'] = root
+        self._request(req)
+
+        return self._response()['snapshot']
+
+    def _request(self, req):
+        self._sock.sendall(json.dumps(req) + '\n')
+
+    def _response(self):
+        line = self._rfile.readline()
+        if not line:
+            raise Exception('connection closed by server')
+
+        resp = json.loads(line)
+        if 'error' in resp:
+            raise Exception(resp['error'])
+        return resp
+
+
+def serve(sock_path, conf, workers=4, max_pending=64):
+    server = FqlServer(sock_path, conf, workers, max_pending)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(sock_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
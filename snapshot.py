@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    snapshot
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-19 16:31:08
+
+import time
+import threading
+from walker import LocalFs, Walker
+
+
+class SnapshotFs(LocalFs):
+    '''
+        Metadata of a file tree captured in memory: the listings of the
+        directories and the stats of their entries, down to 'depth' levels.
+        The walkers use it as a file system, so the queries on the captured
+        tree are executed without any I/O.
+
+        With 'auto_refresh', the mtime of a directory is checked before its
+        listing is returned, and the directory is listed and stat'ed again
+        if it has changed. Only the creation, deletion and renaming of
+        entries changes the mtime of a directory, modified files keep their
+        captured stats until 'refresh'.
+    '''
+    def __init__(self, root, depth, auto_refresh=False):
+        self._root = root
+        self._depth = depth
+        self._auto_refresh = auto_refresh
+        self._local = LocalFs()
+        # directories are refreshed by the queries running concurrently
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        # directory -> list of entries' path
+        self._listings = {}
+        # path -> stat_result
+        self._stats = {}
+        # directory -> mtime when it is listed
+        self._mtimes = {}
+        self._captured_at = time.time()
+        self._refreshed_dirs = 0
+
+        self._recording = True
+        try:
+            Walker(lambda finfo, alias: False, None, None,
+                   self._depth or None, fs=self).walk(self._root)
+        finally:
+            self._recording = False
+
+    def covers(self, start_point, depth):
+        '''
+            check if the query from start_point travelling 'depth' levels can
+            be executed on the snapshot
+        '''
+        if start_point not in self._listings:
+            return False
+
+        if not self._depth:
+            # captured without depth limit
+            return True
+
+        rel = start_point[len(self._root):].strip('/')
+        start_depth = rel.count('/') + 2 if rel else 1
+        return start_depth + depth - 1 <= self._depth
+
+    def list(self, d):
+        if self._recording:
+            return self._list(d)
+
+        if self._auto_refresh:
+            try:
+                mtime = self._local.stat(d).st_mtime
+            except OSError:
+                return []
+            if mtime != self._mtimes.get(d):
+                with self._lock:
+                    self._refreshed_dirs += 1
+                    return self._list(d)
+
+        return self._listings.get(d, [])
+
+    def inodes(self, d):
+        # entries are stat'ed from the file system only when recording
+        return self._local.inodes(d) if self._recording else None
+
+    def stat(self, f):
+        if self._recording or f not in self._stats:
+            self._stats[f] = self._local.stat(f)
+
+        return self._stats[f]
+
+    def info(self):
+        return {
+            'root': self._root,
+            'depth': self._depth,
+            'age': time.time() - self._captured_at,
+            'dirs': len(self._listings),
+            'entries': len(self._stats),
+            'auto_refresh': self._auto_refresh,
+            'refreshed_dirs': self._refreshed_dirs,
+        }
+
+    def _list(self, d):
+        paths = self._local.list(d)
+        self._mtimes[d] = self._local.stat(d).st_mtime
+
+        if not self._recording:
+            # the entries are stat'ed again after the directory is changed
+            for f in self._listings.get(d, []) + paths:
+                self._stats.pop(f, None)
+
+        self._listings[d] = paths
+        return paths
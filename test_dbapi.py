@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    test_dbapi
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-25 10:21:43
+
+import os
+import shutil
+import tempfile
+import unittest
+from dbapi import connect
+
+
+class CursorTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        with open(os.path.join(self.root, 'a.txt'), 'w') as f:
+            f.write('x' * 10)
+        os.utime(os.path.join(self.root, 'a.txt'), (1000000000, 1000000000))
+        self.cur = connect(depth=1).cursor()
+
+    def tearDown(self):
+        self.cur.close()
+        shutil.rmtree(self.root)
+
+    def test_select_order(self):
+        self.cur.execute('select size, name, mtime, path from %s'
+                         % self.root)
+        self.assertEqual([d[0] for d in self.cur.description],
+                         ['size', 'name', 'mtime', 'path'])
+        self.assertEqual(self.cur.fetchall(),
+                         [(10, 'a.txt', 1000000000.0, self.root)])
+
+    def test_unpack_rows(self):
+        self.cur.execute('select name, size from %s' % self.root)
+        for name, size in self.cur:
+            self.assertEqual((name, size), ('a.txt', 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    test_executor
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-25 11:02:17
+
+import os
+import shutil
+import tempfile
+import unittest
+from grammar_parser import parser
+from executor import plan_query, walk_queries, typed_rows, close_query
+from walker import Walker
+
+
+def make_tree(root, paths):
+    '''
+        create the files of paths under root, the paths ending with '/' are
+        directories
+    '''
+    for p in paths:
+        f = os.path.join(root, p)
+        if p.endswith('/'):
+            os.makedirs(f)
+        else:
+            with open(f, 'w') as fp:
+                fp.write(p)
+
+
+def batch_names(root, stmts, conf):
+    '''
+        names selected by each of stmts, executed in one travel
+    '''
+    queries = []
+    for stmt in stmts:
+        kwargs = parser.parse(stmt % root)
+        kwargs.update(conf)
+        queries.append(plan_query(**kwargs))
+
+    walk_queries(root, queries, conf)
+    names = []
+    for q in queries:
+        try:
+            names.append(sorted(r[0] for r in typed_rows(q)[1]))
+        finally:
+            close_query(q)
+    return names
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        make_tree(self.root, ['a/', 'a/x.js', 'node_modules/',
+                              'node_modules/m.js', 'b.js'])
+        self.conf = {'depth': 5}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_mixed_exclude(self):
+        stmts = ['select name from %s',
+                 'select name from %s exclude name in ("a", "node_modules")',
+                 'select name from %s prune name in ("node_modules")',
+                 'select name from %s exclude name like "%%.js"']
+        all_names = ['a', 'b.js', 'm.js', 'node_modules', 'x.js']
+        expected = [all_names, ['b.js'], ['a', 'b.js', 'node_modules', 'x.js'],
+                    ['a', 'node_modules']]
+        self.assertEqual(batch_names(self.root, stmts, self.conf), expected)
+
+        # the same as each statement executed alone
+        for stmt, names in zip(stmts, expected):
+            self.assertEqual(batch_names(self.root, [stmt], self.conf),
+                             [names])
+
+
+class DepthTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        make_tree(self.root, ['a/', 'a/b/', 'a/b/c.txt', 'd.txt'])
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_depth_below_one(self):
+        for cond in ('depth < 1', 'depth <= 0'):
+            kwargs = parser.parse('select name from %s where %s'
+                                  % (self.root, cond))
+            kwargs['depth'] = 0
+            q = plan_query(**kwargs)
+            self.assertEqual(q['depth'], 0)
+            walk_queries(self.root, [q], {})
+            try:
+                self.assertEqual(list(typed_rows(q)[1]), [])
+            finally:
+                close_query(q)
+
+    def test_walker_depth(self):
+        for max_depth, count in ((0, 0), (1, 2), (2, 3), (None, 4)):
+            files = []
+            walker = Walker(lambda finfo, alias: True, None, None, max_depth,
+                            emit=lambda finfo, m: files.append(finfo))
+            walker.walk(self.root)
+            self.assertEqual(len(files), count)
+            self.assertEqual(walker.context()['files'], count)
+
+
+
+class LongPathTest(unittest.TestCase):
+    # directories of long names, deeper than PATH_MAX
+    _NAME = 'd' * 200
+    _LEVELS = 25
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        # created relative to the working directory, as the absolute paths
+        # are too long
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.root)
+            for i in xrange(self._LEVELS):
+                os.mkdir(self._NAME)
+                os.chdir(self._NAME)
+            open('leaf', 'w').close()
+        finally:
+            os.chdir(cwd)
+
+    def tearDown(self):
+        cwd = os.getcwd()
+        try:
+            os.chdir(self.root)
+            for i in xrange(self._LEVELS):
+                os.chdir(self._NAME)
+            os.unlink('leaf')
+            for i in xrange(self._LEVELS):
+                os.chdir('..')
+                os.rmdir(self._NAME)
+        finally:
+            os.chdir(cwd)
+        shutil.rmtree(self.root)
+
+    def test_partial(self):
+        kwargs = parser.parse('select count(*) from %s where name = "leaf"'
+                              % self.root)
+        kwargs['depth'] = 0
+        q = plan_query(**kwargs)
+        walk_queries(self.root, [q], {})
+        try:
+            self.assertEqual(list(typed_rows(q)[1]), [(0, )])
+            self.assertTrue(q['partial'].startswith(
+                'paths longer than PATH_MAX skipped: 1, such as %s'
+                % self.root))
+        finally:
+            close_query(q)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    test_grammar_parser
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-26 10:31:52
+
+import unittest
+from grammar_parser import parser
+
+
+class SelectFieldTest(unittest.TestCase):
+    def assert_error(self, stmt, msg):
+        with self.assertRaises(Exception) as cm:
+            parser.parse(stmt)
+        self.assertTrue(str(cm.exception).startswith(msg))
+
+    def test_unknown_field(self):
+        self.assert_error('select nonsense from .', 'unknown field: nonsense')
+        self.assert_error('select name, nonsense as n from .',
+                          'unknown field: nonsense')
+
+    def test_join_field(self):
+        self.assert_error('select relpath from .',
+                          '\'relpath\' can only be selected in join')
+        self.assert_error('select a.size from .',
+                          '\'a.size\' can only be selected in join')
+
+    def test_known_fields(self):
+        for stmt in ('select * from .',
+                     'select name, path, size, ctime, mtime, atime, lines '
+                     'from .',
+                     'select size as s from .',
+                     'select relpath, a.size from . join . on relpath'):
+            self.assertIn('select', parser.parse(stmt))
+
+
+if __name__ == '__main__':
+    unittest.main()
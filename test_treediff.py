@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    test_treediff
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-26 09:48:05
+
+import os
+import shutil
+import tempfile
+import unittest
+from treediff import save_snapshot, SnapshotDiff
+from print_utils import DiffPrinter
+
+
+class DiffTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        self.snap = tempfile.NamedTemporaryFile(prefix='fql-test-snap-')
+        for name in ('kept.txt', 'removed.txt', 'touched.txt'):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('0123456789')
+        os.utime(os.path.join(self.root, 'touched.txt'),
+                 (1000000000, 1000000000.5))
+        self.conf = {'depth': 1}
+        save_snapshot(self.snap.name, self.root, self.conf)
+
+        os.unlink(os.path.join(self.root, 'removed.txt'))
+        with open(os.path.join(self.root, 'added.txt'), 'w') as f:
+            f.write('01234')
+        os.utime(os.path.join(self.root, 'touched.txt'),
+                 (1000000000, 1000000000.75))
+
+    def tearDown(self):
+        self.snap.close()
+        shutil.rmtree(self.root)
+
+    def diff_rows(self):
+        diff = SnapshotDiff(self.snap.name, self.root, self.conf)
+        try:
+            return [(r[0], r[1], r[3], r[5])
+                    for r in DiffPrinter(diff, True).rows()]
+        finally:
+            diff.close()
+
+    def test_changes(self):
+        self.assertEqual(self.diff_rows(), [
+            ('added', 'added.txt', '+5B', ''),
+            ('removed', 'removed.txt', '-10B', ''),
+            ('modified', 'touched.txt', '', '+0.250s'),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
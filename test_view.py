@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    test_view
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-25 15:37:09
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+from executor import execute_statement
+
+
+def output(stmt, conf):
+    '''
+        printed output of the statement
+    '''
+    out, sys.stdout = sys.stdout, StringIO()
+    try:
+        execute_statement(stmt, conf)
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdout = out
+
+
+class ViewTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='fql-test-')
+        self.store = tempfile.mkdtemp(prefix='fql-test-views-')
+        # files of the same size in several directories, max and min keep
+        # the first file of the ties
+        for d in ('', 'a', 'a/b', 'c', 'node_modules', 'x'):
+            if d:
+                os.mkdir(os.path.join(self.root, d))
+            for name in ('k.txt', 'm.log', 'y.txt'):
+                with open(os.path.join(self.root, d, name), 'w') as f:
+                    f.write('0123456789')
+        self.stmt = 'select ftype, count(*), max(size), min(size), ' \
+            'max(mtime) from %s group by ftype' % self.root
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        shutil.rmtree(self.store)
+
+    def assert_view(self, conf):
+        # the table of the view, without the line of the refresh
+        created = output('create view v as ' + self.stmt, conf)
+        live = output(self.stmt, conf)
+        self.assertEqual(created.rsplit('\n', 2)[0] + '\n', live)
+        self.assertEqual(output('select * from view v', conf), live)
+
+        # some directories are listed again, the others are merged from
+        # their saved partials
+        for d in ('a', 'x'):
+            with open(os.path.join(self.root, d, 'n.txt'), 'w') as f:
+                f.write('0123456789')
+        refreshed = output('refresh view v', conf)
+        live = output(self.stmt, conf)
+        self.assertIn('listed: 2,', refreshed)
+        self.assertEqual(refreshed.rsplit('\n', 2)[0] + '\n', live)
+        self.assertEqual(output('select * from view v', conf), live)
+
+    def test_dfs(self):
+        self.assert_view({'depth': 5, 'view_store': self.store,
+                          'show_border': True})
+
+    def test_bfs(self):
+        self.assert_view({'depth': 5, 'view_store': self.store,
+                          'show_border': True, 'travel_order': 'bfs'})
+
+
+if __name__ == '__main__':
+    unittest.main()
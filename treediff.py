@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    treediff
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-20 15:26:37
+
+import os
+import struct
+import tempfile
+from walker import LocalFs, Walker, travel_context
+
+
+'''
+snapshot file:
+    'FQLSNAP1\n'
+    root '\n'
+    depth '\n'
+    records, sorted by the components of the relative path:
+        - length of the prefix shared with the path of the previous record
+        - length of the rest of the path
+        - the rest of the path
+        - size, mtime, mode
+'''
+
+_MAGIC = 'FQLSNAP1\n'
+_PATH_HEAD = struct.Struct('<HH')
+_STAT = struct.Struct('<qdI')
+_BUF_SIZE = 1024 * 1024
+
+
+class SortedFs(LocalFs):
+    '''
+        list the entries of a directory sorted by name, so the walkers
+        travel the tree in the order of 'path_key'
+    '''
+    def __init__(self, fs=None):
+        self._fs = fs or LocalFs()
+
+    def list(self, d):
+        return sorted(self._fs.list(d))
+
+    def stat(self, f):
+        return self._fs.stat(f)
+
+    def inodes(self, d):
+        return self._fs.inodes(d)
+
+
+def path_key(relpath):
+    # a directory is followed by its entries, then by its next sibling
+    return relpath.split('/')
+
+
+class SnapshotWriter(object):
+    def __init__(self, fpath, root, depth):
+        self._f = open(fpath, 'wb', _BUF_SIZE)
+        self._f.write('%s%s\n%d\n' % (_MAGIC, root, depth))
+        self._root = root
+        self._prev = ''
+        self._count = 0
+
+    def write(self, relpath, statinfo):
+        n = 0
+        max_n = min(len(relpath), len(self._prev), 0xffff)
+        while n < max_n and relpath[n] == self._prev[n]:
+            n += 1
+
+        rest = relpath[n:]
+        self._f.write(_PATH_HEAD.pack(n, len(rest)) + rest +
+                      _STAT.pack(statinfo.st_size, statinfo.st_mtime,
+                                 statinfo.st_mode))
+        self._prev = relpath
+        self._count += 1
+
+    def emit(self, finfo, matched):
+        '''
+            emit of the walkers
+        '''
+        rel = finfo.path[len(self._root):].strip('/')
+        self.write(rel + '/' + finfo.name if rel else finfo.name,
+                   finfo.stat)
+
+    def count(self):
+        return self._count
+
+    def close(self):
+        self._f.close()
+
+
+class SnapshotReader(object):
+    '''
+        records of a snapshot file, which can be iterated several times
+    '''
+    def __init__(self, fpath):
+        self._fpath = fpath
+        with open(fpath, 'rb') as f:
+            if f.readline() != _MAGIC:
+                raise Exception('not a snapshot file: %s' % fpath)
+            self.root = f.readline()[:-1]
+            self.depth = int(f.readline())
+
+    def __iter__(self):
+        '''
+            yield (relative path, size, mtime, mode)
+        '''
+        with open(self._fpath, 'rb', _BUF_SIZE) as f:
+            for i in xrange(3):
+                f.readline()
+
+            prev = ''
+            while True:
+                head = f.read(_PATH_HEAD.size)
+                if not head:
+                    return
+                n, rest_len = _PATH_HEAD.unpack(head)
+                relpath = prev[:n] + f.read(rest_len)
+                size, mtime, mode = _STAT.unpack(f.read(_STAT.size))
+                yield relpath, size, mtime, mode
+                prev = relpath
+
+
+def save_snapshot(fpath, root, conf):
+    '''
+        travel root and save the metadata of all the entries to fpath,
+        return count of entries
+    '''
+    depth = conf.get('depth')
+    fs = SortedFs()
+    writer = SnapshotWriter(fpath, root, depth)
+    try:
+        ctx = travel_context(root, conf.get('one_file_system'), fs=fs)
+        Walker(lambda finfo, alias: True, None, None, depth or None, ctx=ctx,
+               fs=fs, emit=writer.emit).walk(root)
+    finally:
+        writer.close()
+
+    return writer.count()
+
+
+def diff_snapshots(old, new):
+    '''
+        merge join the records of the snapshots, yield
+        (change, path, size, size delta, mtime, mtime delta), change is
+        'added', 'removed' or 'modified'
+    '''
+    old_it, new_it = iter(old), iter(new)
+    o, n = next(old_it, None), next(new_it, None)
+    while o is not None or n is not None:
+        c = -1 if n is None else 1 if o is None else \
+            cmp(path_key(o[0]), path_key(n[0]))
+        if c < 0:
+            yield 'removed', o[0], o[1], -o[1], o[2], None
+            o = next(old_it, None)
+        elif c > 0:
+            yield 'added', n[0], n[1], n[1], n[2], None
+            n = next(new_it, None)
+        else:
+            if o[1] != n[1] or o[2] != n[2] or o[3] != n[3]:
+                yield 'modified', n[0], n[1], n[1] - o[1], n[2], n[2] - o[2]
+            o, n = next(old_it, None), next(new_it, None)
+
+
+class SnapshotDiff(object):
+    '''
+        diff of old snapshot to new snapshot, or to the live tree if new is
+        a directory. The live tree is saved to a temporary snapshot with the
+        depth of old first, so neither tree is loaded in memory.
+    '''
+    def __init__(self, old_path, new_path, conf):
+        self._old = SnapshotReader(old_path)
+        self._tmp = None
+
+        if os.path.isdir(new_path):
+            self._tmp = tempfile.NamedTemporaryFile(prefix='fql-snap-')
+            live_conf = dict(conf)
+            live_conf['depth'] = self._old.depth
+            save_snapshot(self._tmp.name, new_path, live_conf)
+            new_path = self._tmp.name
+
+        self._new = SnapshotReader(new_path)
+
+    def __iter__(self):
+        return diff_snapshots(self._old, self._new)
+
+    def close(self):
+        if self._tmp:
+            self._tmp.close()
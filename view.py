@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    view
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-23 11:27:51
+
+import os
+import re
+import time
+import tempfile
+import cPickle as pickle
+from collections import OrderedDict, deque
+from walker import Walker, travel_context
+
+
+'''
+A materialized view keeps the aggregations of a statement, as the partial
+results of the entries of each directory:
+    {
+        'name': 'v',
+        'stmt': 'select ftype, sum(size) from /data group by ftype',
+        'depth': 3,
+        'created': 1792429259.4,
+        'refreshed': 1792429259.4,
+        'dirs': OrderedDict{path of directory -> (mtime, paths of the
+                            sub-directories entered, segments)}
+    }
+segments are the partials of the entries of the directory before each
+sub-directory entered, and after the last one. partials are the states of
+the aggregations of each group, see 'GroupBy.partials'. A view is refreshed
+by listing only the directories whose mtime has changed, the others are
+merged from their partials, in the order of the travel, see
+'ordered_partials'.
+'''
+
+# prefix of 'from' to select a view, 'from view v' is 'from view:v'
+VIEW_PREFIX = 'view:'
+
+# directory of the view files, one file for each view
+DEFAULT_STORE = '~/.fql/views'
+
+_VIEW_NAME = re.compile(r'^\w+$')
+
+
+class ViewStore(object):
+    '''
+        views saved in the files of a directory
+    '''
+    def __init__(self, path=None):
+        self._path = os.path.expanduser(path or DEFAULT_STORE)
+
+    def load(self, name):
+        try:
+            with open(self._file(name), 'rb') as f:
+                return pickle.load(f)
+        except IOError:
+            raise Exception('no view: %s, in %s' % (name, self._path))
+
+    def save(self, view):
+        if not os.path.isdir(self._path):
+            os.makedirs(self._path)
+
+        # written to a temporary file and renamed, a view being read is
+        # never seen half written
+        fd, tmp = tempfile.mkstemp(prefix='.fql-view-', dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(view, f, 2)
+            os.rename(tmp, self._file(view['name']))
+        except:
+            os.unlink(tmp)
+            raise
+
+    def _file(self, name):
+        if not _VIEW_NAME.match(name):
+            raise Exception('invalid view name: %s' % name)
+        return os.path.join(self._path, name + '.view')
+
+
+def new_view(name, stmt, depth):
+    now = time.time()
+    return {'name': name, 'stmt': stmt, 'depth': depth, 'created': now,
+            'refreshed': now, 'dirs': OrderedDict()}
+
+
+class ViewWalker(Walker):
+    '''
+        Walker refreshing the partials of the directories of a view. The
+        mtime of each directory is compared with the one saved in the view:
+            - unchanged: the saved partials are kept, only its saved
+              sub-directories are stat'ed to be entered
+            - changed or new: it's listed, and its matched entries are
+              aggregated by a new partial GroupBy
+        Only the creation, deletion and renaming of entries changes the
+        mtime of a directory, so the files modified in place keep their
+        aggregated stats until the view is created again.
+    '''
+    def __init__(self, selector, groupby, max_depth, dirs, ctx=None,
+                 fs=None):
+        Walker.__init__(self, selector, None, groupby, max_depth, ctx=ctx,
+                        fs=fs, emit=self._aggregate)
+        self._saved = dirs
+        # the directories travelled, in the form of 'dirs' of the view
+        self.dirs = OrderedDict()
+        # directories listed again
+        self.rescanned = 0
+        # path of directory -> state, see '_new_state', of the directories
+        # being scanned
+        self._scanning = {}
+
+    def _visit(self, start_point, cur_depth, parent_rules):
+        try:
+            mtime = self._fs.stat(start_point).st_mtime
+        except OSError:
+            return
+
+        # recorded before the sub-directories in both cases, in the order
+        # of the travel
+        saved = self._saved.get(start_point)
+        if saved and saved[0] == mtime:
+            self.dirs[start_point] = saved
+            for f in saved[1] if cur_depth < self._max_depth else []:
+                try:
+                    statinfo = self._fs.stat(f)
+                except OSError:
+                    continue
+                if self._enter_dir(f, statinfo):
+                    yield f, None
+            return
+
+        # the entries of the directory are aggregated when it's scanned,
+        # the directories entered in it are visited before its generator
+        # is resumed
+        self.rescanned += 1
+        self.dirs[start_point] = None
+        state = self._scanning[start_point] = self._new_state()
+        subdirs = []
+        for f, rules in Walker._visit(self, start_point, cur_depth,
+                                      parent_rules):
+            subdirs.append(f)
+            self._split(state)
+            yield f, rules
+
+        del self._scanning[start_point]
+        self.dirs[start_point] = (mtime, subdirs, self._saved_state(state))
+
+    def _aggregate(self, finfo, matched):
+        self._add_entry(self._scanning[finfo.path], finfo)
+
+    # state of a directory: a partial GroupBy of each segment when it's
+    # scanned, and their partials when it's saved
+    def _new_state(self):
+        return [self._groupby.clone()]
+
+    def _add_entry(self, state, finfo):
+        state[-1](finfo)
+
+    def _split(self, state):
+        # the following entries are after the sub-directory entered
+        state.append(self._groupby.clone())
+
+    def _saved_state(self, state):
+        return [segment.partials() for segment in state]
+
+
+def ordered_partials(dirs, root, travel_order='dfs'):
+    '''
+        yield the partials of the segments of dirs, in the order their
+        entries are travelled from root by Walker, so the groups are merged
+        in the same order as a query travelling the tree
+    '''
+    if travel_order == 'bfs':
+        queue = deque([root])
+        while queue:
+            saved = dirs.get(queue.popleft())
+            if saved:
+                for partials in saved[2]:
+                    yield partials
+                queue.extend(saved[1])
+        return
+
+    # (directory, index of the segment to merge)
+    stack = [(root, 0)]
+    while stack:
+        d, i = stack.pop()
+        saved = dirs.get(d)
+        if not saved:
+            continue
+
+        mtime, subdirs, segments = saved
+        yield segments[i]
+        if i < len(subdirs):
+            stack.append((d, i + 1))
+            stack.append((subdirs[i], 0))
+
+
+def view_context(query, conf):
+    '''
+        context of the travels of the views and the watched queries, which
+        are never stopped by budgets, see 'travel_context'
+    '''
+    ctx = travel_context(query['from'], conf.get('one_file_system'))
+    for k in ('exclude', 'prune', 'path_prefixes'):
+        ctx[k] = query[k]
+    ctx['travel_order'] = conf.get('travel_order') or 'dfs'
+    ctx['inode_order'] = bool(conf.get('inode_order'))
+    return ctx
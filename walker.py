@@ -0,0 +1,524 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    walker
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-19 14:20:41
+
+import os
+import sys
+import glob
+import errno
+import stat
+import time
+from itertools import izip
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from fileinfo import FileInfo
+from ignore import IgnoreRules
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport of os.scandir
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# if the warning that 'inode_order' isn't supported has been printed
+_inode_order_warned = False
+
+
+def warn_inode_order(reason):
+    '''
+        print a warning once if the entries can't be stat'ed in the order of
+        their inodes, for reason
+    '''
+    global _inode_order_warned
+    if not _inode_order_warned:
+        _inode_order_warned = True
+        print >> sys.stderr, 'warning: --inode-order is ignored, %s' % reason
+
+
+class BudgetExceeded(Exception):
+    '''
+        a budget of the query is exceeded, the travel stops and the result
+        so far is returned as a partial result
+    '''
+    pass
+
+
+class QueryTimeout(BudgetExceeded):
+    pass
+
+
+class LocalFs(object):
+    '''
+        file system operations used by the walkers
+    '''
+    def list(self, d):
+        return glob.glob(d + '/*')
+
+    def stat(self, f):
+        return os.stat(f)
+
+    def inodes(self, d):
+        '''
+            name -> inode of the entries in d, read from the directory
+            without stat. None if it's not supported.
+        '''
+        if scandir is None:
+            return None
+
+        try:
+            return dict((e.name, e.inode()) for e in scandir(d))
+        except OSError:
+            return None
+
+
+def travel_context(start_point, one_file_system=False, unique_inodes=False,
+                   fs=None):
+    '''
+        - 'root_dev': device of start_point, directories on other devices
+          aren't entered. None if crossing file systems is allowed.
+        - 'dirs': (st_dev, st_ino) of the entered directories, each
+          directory is entered once, which breaks symlink loops
+        - 'inodes': (st_dev, st_ino) of the aggregated files, None if hard
+          links are aggregated as different files
+        - 'deadline': time when the travel is aborted, None if no limit
+        - 'max_files': max entries travelled, 0 if no limit
+        - 'files': entries travelled
+        - 'pending_dirs': directories found but not travelled yet
+        - 'progress': Progress of the travel, None if not shown
+        - 'travel_order': 'dfs' or 'bfs', see 'Walker'
+        - 'path_prefixes': the 'path_prefixes' hint of the where condition,
+          directories which can't contain a match aren't entered. None if
+          no hint.
+        - 'exclude': boolean func(path of entry), the matched entries are
+          skipped before they are stat'ed. None if nothing is excluded.
+        - 'prune': boolean func(path of entry), the matched directories
+          aren't entered. None if nothing is pruned.
+        - 'ignore_files': names of the ignore files read in each directory,
+          the ignored entries are skipped. None if ignore files are not
+          respected.
+        - 'inode_order': stat the entries of a directory in the order of
+          their inodes, the entries are still selected in the order of the
+          listing
+        - 'long_paths': entries skipped as their paths are longer than
+          PATH_MAX, 'long_path' is the first of them. See 'skipped_paths'.
+    '''
+    statinfo = (fs or LocalFs()).stat(start_point)
+    return {
+        'root_dev': statinfo.st_dev if one_file_system else None,
+        'dirs': set([(statinfo.st_dev, statinfo.st_ino)]),
+        'inodes': set() if unique_inodes else None,
+        'deadline': None,
+        'max_files': 0,
+        'files': 0,
+        'pending_dirs': 0,
+        'started': time.time(),
+        'progress': None,
+        'travel_order': 'dfs',
+        'path_prefixes': None,
+        'pruned_dirs': 0,
+        'exclude': None,
+        'prune': None,
+        'ignore_files': None,
+        'inode_order': False,
+        'excluded': 0,
+        'pruned_mounts': 0,
+        'skipped_dirs': 0,
+        'skipped_inodes': 0,
+        'long_paths': 0,
+        'long_path': None,
+    }
+
+
+def skipped_paths(ctx):
+    '''
+        why the entries of the travel are incomplete though it's not
+        stopped, None if all the entries are travelled
+    '''
+    if not ctx['long_paths']:
+        return None
+    return 'paths longer than PATH_MAX skipped: %d, such as %s...' % (
+        ctx['long_paths'], ctx['long_path'][:64])
+
+
+def check_budget(ctx, start_point):
+    deadline = ctx['deadline']
+    if deadline and time.time() > deadline:
+        raise QueryTimeout('query timeout, travelling %s' % start_point)
+
+    if ctx['progress']:
+        ctx['progress'].update()
+
+
+def count_file(ctx):
+    if ctx['max_files'] and ctx['files'] >= ctx['max_files']:
+        raise BudgetExceeded('exceed max files, limit: %d' % ctx['max_files'])
+    ctx['files'] += 1
+
+
+class Progress(object):
+    '''
+        Print the progress of a travel to stderr: files travelled, files per
+        second, directories waiting to be travelled and the elapsed time.
+        It's printed once a second, after the travel has run 'delay'
+        seconds, so short queries print nothing.
+    '''
+    def __init__(self, ctx, out=sys.stderr, delay=2):
+        self._ctx = ctx
+        self._out = out
+        self._next = ctx['started'] + delay
+        self._shown = False
+
+    def update(self):
+        now = time.time()
+        if now < self._next:
+            return
+        self._next = now + 1
+
+        ctx = self._ctx
+        elapsed = now - ctx['started']
+        self._out.write('\r%d files, %d files/s, %d directories queued, '
+                        '%ds elapsed ' % (ctx['files'],
+                                          ctx['files'] / elapsed,
+                                          ctx['pending_dirs'], elapsed))
+        self._out.flush()
+        self._shown = True
+
+    def done(self):
+        if self._shown:
+            self._out.write('\n')
+            self._out.flush()
+
+
+def may_contain(prefixes, d):
+    '''
+        check if any file in the subtree of directory d can match the
+        'path_prefixes' hint, the paths in the subtree are d or 'd/...'
+    '''
+    for t in prefixes:
+        for prefix in t:
+            if d.startswith(prefix) or \
+                    prefix.startswith(d) and (len(prefix) == len(d) or
+                                             prefix[len(d)] == '/'):
+                break
+        else:
+            return False
+
+    return True
+
+
+class Walker(object):
+    '''
+        Travel the file tree in depth-first or breadth-first order, which
+        is the 'travel_order' of ctx, the entries of a directory are visited
+        in the order of glob. The matched files are appended to 'files' and
+        aggregated by 'groupby'.
+
+        The travel is iterative, so trees of any depth can be travelled with
+        'max_depth' None(no limit), while 'max_depth' 0 travels nothing. In
+        depth-first order, the frontier is the remaining entries of the
+        directories on the current path. In breadth-first order, it's a
+        queue of the paths of the directories to travel.
+    '''
+    def __init__(self, selector, files, groupby, max_depth=3, reader=None,
+                 ctx=None, fs=None, emit=None):
+        # @param selector(func: boolean selector(finfo, aliases))
+        # @param files(FileRows or list of FileInfo)
+        # @param emit(func: emit(finfo, matched)): called with the result of
+        #   selector for each matched file, instead of appending it to files
+        #   and groupby
+        # @param reader(ContentReader): evaluate selector in the I/O threads
+        #   of reader, None if the query doesn't read file contents
+        # @param ctx(dict): state shared by the whole travel, see
+        #   'travel_context'
+        self._selector = selector
+        self._files = files
+        self._groupby = groupby
+        self._max_depth = sys.maxint if max_depth is None else max_depth
+        self._reader = reader
+        self._ctx = ctx
+        self._fs = fs or LocalFs()
+        self._emit = emit or self._append
+
+    def walk(self, start_point):
+        if self._ctx is None:
+            self._ctx = travel_context(start_point, fs=self._fs)
+
+        try:
+            self._travel(start_point, 1)
+        finally:
+            self.close()
+
+    def close(self):
+        pass
+
+    def context(self):
+        return self._ctx
+
+    def _travel(self, start_point, cur_depth):
+        if cur_depth > self._max_depth:
+            return
+
+        if self._ctx['travel_order'] == 'bfs':
+            # (path, depth, IgnoreRules of its parent)
+            queue = deque([(start_point, cur_depth, None)])
+            while queue:
+                d, depth, rules = queue.popleft()
+                queue.extend((f, depth + 1, r) for f, r in
+                             self._visit(d, depth, rules))
+            return
+
+        # (directories to enter in a directory, their depth)
+        stack = [(self._visit(start_point, cur_depth, None), cur_depth + 1)]
+        while stack:
+            dirs, depth = stack[-1]
+            sub = next(dirs, None)
+            if sub is None:
+                stack.pop()
+            else:
+                f, rules = sub
+                stack.append((self._visit(f, depth, rules), depth + 1))
+
+    def _visit(self, start_point, cur_depth, parent_rules):
+        '''
+            select the entries of start_point, yield (path, IgnoreRules) of
+            the sub-directories to enter, after the entries before them are
+            selected
+        '''
+        ctx = self._ctx
+        check_budget(ctx, start_point)
+
+        rules = self._ignore_rules(start_point, parent_rules)
+        paths, finfos = self._scan(start_point, cur_depth, rules)
+        aliases = self._groupby.get_aliases() if self._groupby else None
+        if self._reader:
+            matched = self._reader.select(self._selector, finfos, aliases)
+        else:
+            matched = (self._selector(finfo, aliases) for finfo in finfos)
+
+        can_enter = cur_depth < self._max_depth
+        if can_enter:
+            ctx['pending_dirs'] += sum(1 for finfo in finfos
+                                       if stat.S_ISDIR(finfo.stat.st_mode))
+
+        for f, finfo, m in izip(paths, finfos, matched):
+            count_file(ctx)
+            statinfo = finfo.stat
+            if m:
+                self._emit(finfo, m)
+
+            if can_enter and stat.S_ISDIR(statinfo.st_mode):
+                ctx['pending_dirs'] -= 1
+                if self._enter_dir(f, statinfo):
+                    yield f, rules
+
+    def _append(self, finfo, matched):
+        self._files.append(finfo)
+
+        if self._ctx['inodes'] is None or self._first_inode(finfo.stat):
+            self._groupby(finfo)
+
+    def _scan(self, start_point, cur_depth, rules=None):
+        '''
+            return paths and finfos of the entries in start_point, except
+            the entries ignored by rules
+        '''
+        paths, finfos = [], []
+        fs_paths = self._listing(start_point)
+        for f, statinfo in izip(fs_paths, self._stat_all(start_point,
+                                                         fs_paths)):
+            if statinfo is None or \
+                    rules and self._ignored(rules, f, statinfo):
+                continue
+            paths.append(f)
+            finfos.append(self._finfo(start_point, f, statinfo, cur_depth))
+
+        return paths, finfos
+
+    def _stat_all(self, start_point, paths):
+        '''
+            stats of paths, None if an entry is removed during the travel or
+            is a dangling symlink. With 'inode_order', the entries are
+            stat'ed in the order of their inodes, which are close to the
+            order of the inode table on disk, to reduce seeks.
+        '''
+        order = xrange(len(paths))
+        if self._ctx['inode_order'] and scandir is None:
+            warn_inode_order('it needs os.scandir or the \'scandir\' package '
+                             'on Python 2')
+        inodes = self._fs.inodes(start_point) \
+            if self._ctx['inode_order'] and len(paths) > 1 else None
+        if inodes:
+            order = sorted(order, key=lambda i: inodes.get(
+                os.path.basename(paths[i]), 0))
+
+        statinfos = [None] * len(paths)
+        for i in order:
+            try:
+                statinfos[i] = self._fs.stat(paths[i])
+            except OSError as e:
+                self._stat_failed(paths[i], e)
+
+        return statinfos
+
+    def _stat_failed(self, f, e):
+        if e.errno == errno.ENAMETOOLONG:
+            ctx = self._ctx
+            ctx['long_paths'] += 1
+            if ctx['long_path'] is None:
+                ctx['long_path'] = f
+
+    def _listing(self, start_point, listing=None):
+        '''
+            entries of start_point except the excluded ones
+        '''
+        paths = self._fs.list(start_point) if listing is None else listing
+        exclude = self._ctx['exclude']
+        if exclude is None:
+            return paths
+
+        included = [f for f in paths if not exclude(f)]
+        self._ctx['excluded'] += len(paths) - len(included)
+        return included
+
+    def _ignore_rules(self, start_point, parent_rules):
+        names = self._ctx['ignore_files']
+        if not names:
+            return None
+
+        return IgnoreRules.load(start_point, parent_rules, names)
+
+    def _ignored(self, rules, f, statinfo):
+        if rules.ignored(f, stat.S_ISDIR(statinfo.st_mode)):
+            self._ctx['excluded'] += 1
+            return True
+        return False
+
+    def _finfo(self, start_point, f, statinfo, cur_depth):
+        return FileInfo(os.path.basename(f), start_point, statinfo,
+                        depth=cur_depth)
+
+    def _can_enter(self, statinfo):
+        ctx = self._ctx
+        if ctx['root_dev'] is not None and statinfo.st_dev != ctx['root_dev']:
+            return False
+        return (statinfo.st_dev, statinfo.st_ino) not in ctx['dirs']
+
+    def _enter_dir(self, f, statinfo):
+        ctx = self._ctx
+        if ctx['root_dev'] is not None and statinfo.st_dev != ctx['root_dev']:
+            ctx['pruned_mounts'] += 1
+            return False
+
+        k = (statinfo.st_dev, statinfo.st_ino)
+        if k in ctx['dirs']:
+            ctx['skipped_dirs'] += 1
+            return False
+
+        if not self._may_contain(f):
+            ctx['pruned_dirs'] += 1
+            return False
+
+        if self._pruned(f):
+            ctx['excluded'] += 1
+            return False
+
+        ctx['dirs'].add(k)
+        return True
+
+    def _may_contain(self, d):
+        prefixes = self._ctx['path_prefixes']
+        return prefixes is None or may_contain(prefixes, d)
+
+    def _pruned(self, d):
+        prune = self._ctx['prune']
+        return prune is not None and prune(d)
+
+    def _first_inode(self, statinfo):
+        ctx = self._ctx
+        k = (statinfo.st_dev, statinfo.st_ino)
+        if k in ctx['inodes']:
+            ctx['skipped_inodes'] += 1
+            return False
+
+        ctx['inodes'].add(k)
+        return True
+
+
+class ThreadedWalker(Walker):
+    '''
+        Walker for file systems with high latency operations, such as FUSE
+        mounted object stores. Listings and stats are issued to a pool of
+        'concurrency' threads: the stats of a directory run concurrently,
+        and the listings of its sub-directories are prefetched as soon as
+        the directory is scanned. The results are consumed in the same
+        depth-first order as Walker, so 'selector' and 'groupby' are still
+        called from one thread and the output is identical.
+    '''
+    def __init__(self, selector, files, groupby, max_depth=3, reader=None,
+                 ctx=None, fs=None, emit=None, concurrency=16):
+        Walker.__init__(self, selector, files, groupby, max_depth, reader,
+                        ctx, fs, emit)
+        self._pool = ThreadPool(concurrency)
+        # path -> AsyncResult of the listing
+        self._listings = {}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _scan(self, start_point, cur_depth, rules=None):
+        # the entries are stat'ed concurrently, in no particular order
+        if self._ctx['inode_order']:
+            warn_inode_order('the thread engine stats the entries '
+                             'concurrently')
+
+        listing = self._listings.pop(start_point, None)
+        if listing is None:
+            listing = self._pool.apply_async(self._fs.list, (start_point,))
+
+        paths, finfos = [], []
+        fs_paths = self._listing(start_point, listing.get())
+        for f, statinfo in izip(fs_paths,
+                                self._pool.imap(self._stat, fs_paths)):
+            if isinstance(statinfo, OSError):
+                self._stat_failed(f, statinfo)
+                continue
+            if rules and self._ignored(rules, f, statinfo):
+                continue
+            paths.append(f)
+            finfos.append(self._finfo(start_point, f, statinfo, cur_depth))
+
+            # prefetch the directories which will be entered
+            if stat.S_ISDIR(statinfo.st_mode) and \
+                    cur_depth < self._max_depth and \
+                    self._can_enter(statinfo) and self._may_contain(f) and \
+                    not self._pruned(f):
+                self._listings[f] = self._pool.apply_async(self._fs.list,
+                                                           (f,))
+
+        return paths, finfos
+
+    def _enter_dir(self, f, statinfo):
+        if Walker._enter_dir(self, f, statinfo):
+            return True
+
+        # drop the prefetched listing of a directory which isn't entered
+        self._listings.pop(f, None)
+        return False
+
+    def _stat(self, f):
+        # the errors are counted by the thread of the travel
+        try:
+            return self._fs.stat(f)
+        except OSError as e:
+            return e
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+#
+# @file:    watch
+# @author:  chosen0ne(louzhenlin86@126.com)
+# @date:    2026-10-24 10:12:36
+
+import time
+from collections import OrderedDict
+from view import ViewWalker, view_context
+
+
+# stats compared to find the updated entries
+_STATS = ('st_size', 'st_mtime', 'st_ctime', 'st_mode', 'st_ino')
+
+
+def _changed(old, new):
+    return any(getattr(old, k) != getattr(new, k) for k in _STATS)
+
+
+class WatchWalker(ViewWalker):
+    '''
+        ViewWalker keeping the matched entries of each directory, as an
+        OrderedDict{name -> FileInfo}, so the entries of a directory listed
+        again are compared with the ones aggregated before
+    '''
+    def _new_state(self):
+        return OrderedDict()
+
+    def _add_entry(self, state, finfo):
+        state[finfo.name] = finfo
+
+    def _split(self, state):
+        pass
+
+    def _saved_state(self, state):
+        return state
+
+
+class WatchQuery(object):
+    '''
+        Keep the aggregations of a query up to date. The first refresh
+        travels the whole tree, the following ones list only the directories
+        whose mtime has changed, see 'ViewWalker', and apply the changes of
+        their entries to the groups:
+            - inserted: the entry is accumulated
+            - deleted: the entry is retracted from its group
+            - updated, whose stat has changed: retracted and accumulated
+              again
+        max and min can't retract their own value, the groups of such
+        entries are reset and accumulated again from the entries kept in
+        memory, without listing the directories.
+    '''
+    def __init__(self, query, conf):
+        self.query = query
+        self._conf = conf
+        self._groupby = query['groupby']
+        # path of directory -> (mtime, subdirs, entries), see 'WatchWalker'
+        self._dirs = {}
+        # dimension -> count of entries in the group
+        self._sizes = {}
+        self.refreshes = 0
+
+    def refresh(self):
+        '''
+            travel the root and update the groups of the query, return the
+            stats of the refresh
+        '''
+        start = time.time()
+        query = self.query
+        ctx = view_context(query, self._conf)
+        walker = WatchWalker(query['where'], self._groupby, query['depth'],
+                             self._dirs, ctx)
+        walker.walk(query['from'])
+
+        stats = {'inserted': 0, 'deleted': 0, 'updated': 0}
+        # groups to be accumulated again
+        dirty = set()
+        for d, old in self._dirs.iteritems():
+            new = walker.dirs.get(d)
+            if new is old:
+                continue
+
+            entries = new[2] if new else {}
+            for name, finfo in old[2].iteritems():
+                cur = entries.get(name)
+                if cur is None:
+                    stats['deleted'] += 1
+                    self._retract(finfo, dirty)
+                elif _changed(finfo.stat, cur.stat):
+                    stats['updated'] += 1
+                    self._retract(finfo, dirty)
+                    self._insert(cur)
+
+        for d, new in walker.dirs.iteritems():
+            old = self._dirs.get(d)
+            if new is old:
+                continue
+
+            entries = old[2] if old else {}
+            for name, finfo in new[2].iteritems():
+                if name not in entries:
+                    stats['inserted'] += 1
+                    self._insert(finfo)
+
+        if dirty:
+            for dim in dirty:
+                self._groupby.reset_group(dim)
+            for mtime, subdirs, entries in walker.dirs.itervalues():
+                for finfo in entries.itervalues():
+                    if self._groupby.dimension(finfo) in dirty:
+                        self._groupby(finfo)
+
+        self._dirs = walker.dirs
+        self.refreshes += 1
+        stats.update({
+            'refresh': self.refreshes,
+            'dirs': len(walker.dirs),
+            'rescanned': walker.rescanned,
+            'recomputed': len(dirty),
+            'cost': time.time() - start,
+        })
+        return stats
+
+    def _insert(self, finfo):
+        self._groupby(finfo)
+        dim = self._groupby.dimension(finfo)
+        self._sizes[dim] = self._sizes.get(dim, 0) + 1
+
+    def _retract(self, finfo, dirty):
+        dim = self._groupby.dimension(finfo)
+        self._sizes[dim] -= 1
+        if not self._sizes[dim]:
+            del self._sizes[dim]
+            self._groupby.remove_group(dim)
+            dirty.discard(dim)
+        elif not self._groupby.retract(finfo):
+            dirty.add(dim)